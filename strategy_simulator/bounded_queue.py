@@ -1,33 +1,72 @@
 from collections import deque
-from typing import Optional, TypeVar, Deque, Tuple, Generic
+import typing
+from typing import Optional, TypeVar, Deque, Generic
 
 from .clock import ClockView
 
+if typing.TYPE_CHECKING:
+    from .convergence import ConvergenceTracker
+
 T = TypeVar('T')
 
 
 class BoundedQueue(Generic[T]):
-    def __init__(self, clock: ClockView, maxlen: Optional[int] = None, debug: bool = False):
-        self._q: Deque[T] = deque(maxlen=maxlen)
+    """
+    Items pushed at a time can be popped from the next time on. Items pushed at the current time are kept apart
+    from the ready ones, the two buffers are merged lazily once the clock has advanced, thus items carry no timestamp.
+    """
+    def __init__(self, clock: ClockView, maxlen: Optional[int] = None):
+        self.maxlen: Optional[int] = maxlen
+        self._ready: Deque[T] = deque()
+        self._pushed: Deque[T] = deque()
+        self._pushed_at: int = 0  # time at which the items of _pushed have been pushed
         self._clock: ClockView = clock
-        self._debug: bool = debug
         self._max_used: int = 0
+        self.occupancy_tracker: Optional['ConvergenceTracker'] = None  # counts messages in all queues
 
-    def push(self, item: T) -> Optional[Tuple[int, T]]:
-        if self._debug and self._q.maxlen and len(self._q) == self._q.maxlen:
-            dropped = self.pop()
-            self._q.append((self._clock.now, item))
-            return dropped
+    def push(self, item: T) -> Optional[T]:
+        """Appends the item, the oldest item is dropped and returned if the queue is full"""
+        self._advance()
+        dropped = None
+        if self.maxlen and self.size() == self.maxlen:
+            dropped = self._ready.popleft() if self._ready else self._pushed.popleft()
+        elif self.occupancy_tracker is not None:
+            self.occupancy_tracker.queued_messages += 1
 
-        self._q.append((self._clock.now, item))
-        self._max_used = max(self._max_used, len(self._q))
+        self._pushed_at = self._clock.now
+        self._pushed.append(item)
+        self._max_used = max(self._max_used, self.size())
+        return dropped
 
     def pop(self) -> Optional[T]:
-        if len(self._q) > 0:
-            ts, item = self._q[0]
-            if ts < self._clock.now:
-                return self._q.popleft()[1]
+        self._advance()
+        if self._ready:
+            if self.occupancy_tracker is not None:
+                self.occupancy_tracker.queued_messages -= 1
+            return self._ready.popleft()
         return None
 
+    def reset(self):
+        self._ready.clear()
+        self._pushed.clear()
+        self._pushed_at = 0
+        self._max_used = 0
+
     def size(self) -> int:
-        return len(self._q)
+        return len(self._ready) + len(self._pushed)
+
+    def next_ready_time(self) -> Optional[int]:
+        """Earliest time at which pop() returns an item (might be in the past), None if the queue is empty"""
+        if self._ready:
+            return self._clock.now
+        if self._pushed:
+            return self._pushed_at + 1
+        return None
+
+    def _advance(self):
+        if self._pushed and self._pushed_at < self._clock.now:
+            if self._ready:
+                self._ready.extend(self._pushed)
+                self._pushed.clear()
+            else:
+                self._ready, self._pushed = self._pushed, self._ready
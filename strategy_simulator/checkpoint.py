@@ -0,0 +1,107 @@
+import gzip
+import os
+import pickle
+import random
+import threading
+import time
+from typing import Callable, List, Optional
+
+from .device import Device
+from .simulator import Simulator
+
+CHECKPOINT_FORMAT = 'rofi-upgrade-strategy-simulator/checkpoint'
+CHECKPOINT_VERSION = 20
+
+
+def save_checkpoint(s: Simulator, path: str):
+    """Writes the state of the simulation together with the state of the global RNG into a compressed file"""
+    _write(path, _snapshot(s))
+
+
+def load_checkpoint(path: str) -> Simulator:
+    """Loads a simulation saved by save_checkpoint and restores the state of the global RNG"""
+    with gzip.open(path, 'rb') as f:
+        checkpoint = pickle.load(f)
+
+    if not isinstance(checkpoint, dict) or checkpoint.get('format') != CHECKPOINT_FORMAT:
+        raise ValueError(f"{path} is not a checkpoint")
+    if checkpoint['version'] != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {checkpoint['version']}, expected {CHECKPOINT_VERSION}")
+
+    random.setstate(checkpoint['rng_state'])
+    return checkpoint['simulator']
+
+
+def resume(path: str, stop_condition_factory: Callable[[Simulator], Callable[[List[Device]], bool]],
+           checkpointer: Optional['Checkpointer'] = None) -> Simulator:
+    """
+    Continues the run saved in the checkpoint until stop_condition_factory(simulator) holds,
+    e.g. resume(path, tracked_stopping_condition)
+    The run is identical to the one which has been checkpointed as long as the stop condition is the same.
+    """
+    s = load_checkpoint(path)
+    if checkpointer is not None:
+        s.attach_checkpointer(checkpointer)
+    s.run_until(stop_condition_factory(s))
+    if checkpointer is not None:
+        checkpointer.wait()
+    return s
+
+
+class Checkpointer:
+    """
+    Periodically checkpoints a running simulation (see Simulator.attach_checkpointer) every every_ticks ticks
+    and/or every_seconds seconds of wall time. The state is pickled in between of ticks, compression and writing
+    are done by a background thread. The file is replaced atomically thus always holds a complete checkpoint.
+    """
+    def __init__(self, path: str, every_ticks: Optional[int] = None, every_seconds: Optional[float] = None):
+        if every_ticks is None and every_seconds is None:
+            raise ValueError("Either every_ticks or every_seconds must be given")
+
+        self.path: str = path
+        self.every_ticks: Optional[int] = every_ticks
+        self.every_seconds: Optional[float] = every_seconds
+        self._last_tick: Optional[int] = None
+        self._last_time: float = time.monotonic()
+        self._writer: Optional[threading.Thread] = None
+
+    def on_tick(self, s: Simulator):
+        now = s.clock.now
+        if self._last_tick is None:
+            self._last_tick = now
+
+        due = self.every_ticks is not None and now - self._last_tick >= self.every_ticks
+        due = due or self.every_seconds is not None and time.monotonic() - self._last_time >= self.every_seconds
+        if due:
+            self.checkpoint(s)
+
+    def checkpoint(self, s: Simulator):
+        snapshot = _snapshot(s)
+        self.wait()  # at most one checkpoint is being written at a time
+        self._writer = threading.Thread(target=_write, args=(self.path, snapshot))
+        self._writer.start()
+        self._last_tick = s.clock.now
+        self._last_time = time.monotonic()
+
+    def wait(self):
+        """Waits until the last checkpoint is written"""
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+
+
+def _snapshot(s: Simulator) -> bytes:
+    checkpoint = {
+        'format': CHECKPOINT_FORMAT,
+        'version': CHECKPOINT_VERSION,
+        'rng_state': random.getstate(),
+        'simulator': s,
+    }
+    return pickle.dumps(checkpoint, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _write(path: str, snapshot: bytes):
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, 'wb', compresslevel=1) as f:
+        f.write(snapshot)
+    os.replace(tmp_path, path)
@@ -9,6 +9,14 @@ class Clock:
     def tick(self):
         self._time += 1
 
+    def jump_to(self, time: int):
+        if time < self._time:
+            raise ValueError(f"Cannot move clock backwards from {self._time} to {time}")
+        self._time = time
+
+    def reset(self, time: int = 0):
+        self._time = time
+
     def clock_view(self):
         return ClockView(self)
 
@@ -0,0 +1,64 @@
+import typing
+from typing import Dict, Tuple, Optional, Iterable
+
+from .messages import Version
+
+if typing.TYPE_CHECKING:
+    from .device import Device, DeviceType
+
+
+class ConvergenceTracker:
+    """
+    Keeps count of devices running each firmware version per device type
+    Devices report their upgrades, thus questions like "are all type B devices running v2" are answered in O(1)
+    Also counts messages waiting in input queues and the progress of upgrades (chunks received and upgrades
+    committed), which tells whether the simulation is going anywhere.
+    """
+    def __init__(self):
+        self._devices: Dict['DeviceType', int] = {}
+        self._devices_total: int = 0
+        self._versions: Dict[Tuple['DeviceType', Version], int] = {}
+        self._versions_total: Dict[Version, int] = {}
+        self.queued_messages: int = 0
+        self.progress: int = 0
+
+    def track(self, devices: Iterable['Device']):
+        """(Re)initializes the counters from the current state of the devices and subscribes them to this tracker"""
+        self._devices = {}
+        self._devices_total = 0
+        self._versions = {}
+        self._versions_total = {}
+        self.queued_messages = 0
+        self.progress = 0
+
+        for d in devices:
+            d.convergence_tracker = self
+            d._input_queue._q.occupancy_tracker = self
+            self.queued_messages += d._input_queue._q.size()
+            self._devices[d.dev_type] = self._devices.get(d.dev_type, 0) + 1
+            self._devices_total += 1
+            self._add(d.dev_type, d.running_firmware.version, 1)
+
+    def on_upgrade(self, dev_type: 'DeviceType', old_version: Version, new_version: Version):
+        self._add(dev_type, old_version, -1)
+        self._add(dev_type, new_version, 1)
+        self.progress += 1
+
+    def on_chunk_received(self):
+        self.progress += 1
+
+    def devices_with_fw_ver(self, version: Version, dev_type: Optional['DeviceType'] = None) -> int:
+        if dev_type is None:
+            return self._versions_total.get(version, 0)
+        return self._versions.get((dev_type, version), 0)
+
+    def all_have_fw_ver(self, version: Version, dev_type: Optional['DeviceType'] = None) -> bool:
+        """Same as all_devices_pass(devices, device_has_fw_ver(version, dev_type))"""
+        if dev_type is None:
+            return self._versions_total.get(version, 0) == self._devices_total
+        return self._versions.get((dev_type, version), 0) == self._devices.get(dev_type, 0)
+
+    def _add(self, dev_type: 'DeviceType', version: Version, count: int):
+        key = (dev_type, version)
+        self._versions[key] = self._versions.get(key, 0) + count
+        self._versions_total[version] = self._versions_total.get(version, 0) + count
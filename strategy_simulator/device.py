@@ -1,26 +1,28 @@
-import dataclasses as dcs
 from math import ceil
-from typing import Dict, Optional, Any, List
+from typing import Dict, Optional
 
-from .firmware import Firmware
-from .metrics import counted
+from .firmware import Firmware, FirmwareImages
 from .messages import ChunkDescriptor, AnyMessage, DataMessage, AnnounceMessage, RequestMessage, Proto, RawData, FWType, \
     Version
-from .iqueue import WriteQueue, ReadQueue
+from .iqueue import MulticastGroup, WriteQueue, ReadQueue
 from .clock import ClockView
 from .rs_store import RecentlySeenStore, RequestStore
+from .convergence import ConvergenceTracker
 
 DeviceId = int
 DeviceType = int
 
 
 class OngoingUpgrade:
-    def __init__(self, fw_type: FWType, version: Version, proto: Proto):
+    def __init__(self, fw_type: FWType, version: Version, proto: Proto, images: Optional[FirmwareImages] = None):
         self.fw_type: FWType = fw_type
         self.version: Version = version
         self.proto: Proto = proto
         self.last_progress: int = -1
-        self.candidate_firmware: Firmware = Firmware(fw_type, version, [None] * proto.chunks)
+        if images is not None:
+            self.candidate_firmware: Firmware = images.empty_firmware(fw_type, version, proto.chunks)
+        else:
+            self.candidate_firmware: Firmware = Firmware(fw_type, version, [None] * proto.chunks)
 
 
 class Device:
@@ -30,30 +32,51 @@ class Device:
     # reliability alone thus reliability should, from this PoV, be a property of the device
     def __init__(self, dev_id: DeviceId, dev_type: DeviceType, input_queue: ReadQueue,
                  neighbors: Dict[DeviceId, WriteQueue], running_firmware: Firmware, clock: ClockView,
-                 diff_announces_seen_store=None, in_flight_requests_store=None, datas_seen_store=None):
+                 diff_announces_seen_store=None, in_flight_requests_store=None, datas_seen_store=None,
+                 periodic_announce: int = 100, progress_timeout: int = 100,
+                 firmware_images: Optional[FirmwareImages] = None):
         self.dev_id: DeviceId = dev_id
         self.dev_type: DeviceType = dev_type
 
         self._clock = clock
-        self._stats: Dict[Any, Any] = {}  # temporary solution, to be moved to simulator
         self._input_queue: ReadQueue = input_queue
         self.neighbors: Dict[DeviceId, WriteQueue] = neighbors
+        self._multicast: MulticastGroup = MulticastGroup(dev_id, neighbors)
 
         self.running_firmware: Firmware = running_firmware
+        self._initial_firmware: Firmware = running_firmware  # running firmwares are never modified, see reset()
+        self._firmware_images: Optional[FirmwareImages] = firmware_images
 
         self._ongoing_upgrade: Optional[OngoingUpgrade] = None
         self._current_message: Optional[AnyMessage] = None
+        self._current_sender: Optional[DeviceId] = None
+        self.convergence_tracker: Optional[ConvergenceTracker] = None
 
-        self.periodic_announce: int = 100
+        self.periodic_announce: int = periodic_announce
         self._last_periodic_announce: int = -self.periodic_announce
 
-        self.progress_timeout: int = 100
+        self.progress_timeout: int = progress_timeout
         # self._last_progress resides inside self._ongoing_upgrade
 
         self._diff_announces_seen_store = diff_announces_seen_store or RecentlySeenStore(self._clock, timeout=self.periodic_announce//2, max_capacity=None)
         self._in_flight_requests_store = in_flight_requests_store or RequestStore(self._clock, timeout=self.progress_timeout//2, max_capacity=None)
         self._datas_seen_store = datas_seen_store or RecentlySeenStore(self._clock, timeout=self.progress_timeout//2, max_capacity=None)
 
+    def reset(self):
+        """Restores the state the device was created in, i.e. the initial firmware, empty stores and input queue"""
+        self.running_firmware = self._initial_firmware
+        self._ongoing_upgrade = None
+        self._current_message = None
+        self._current_sender = None
+        self._last_periodic_announce = -self.periodic_announce
+
+        self._input_queue.reset()
+        for q in self.neighbors.values():
+            q.reset()
+        self._diff_announces_seen_store.reset()
+        self._in_flight_requests_store.reset()
+        self._datas_seen_store.reset()
+
     @property
     def upgrading(self) -> bool:
         """The device is being upgraded/is in a process of upgrade of its firmware"""
@@ -80,11 +103,11 @@ class Device:
         if isinstance(m, AnnounceMessage):
             if not self._diff_announces_seen_store.recently_seen(m.dsc):
                 self._diff_announces_seen_store.mark_recently_seen(m.dsc)
-                self._announce_chunk(m.dsc, exclude_devices=[m.proto.from_device])
+                self._announce_chunk(m.dsc, exclude_device=self._current_sender)
             return True
 
         if isinstance(m, RequestMessage):
-            self._request_chunk_for_device(m.proto.from_device, m.dsc)
+            self._request_chunk_for_device(self._current_sender, m.dsc)
             return True
 
         return False
@@ -105,7 +128,7 @@ class Device:
         if self._ongoing_upgrade.candidate_firmware.is_chunk_present(m.dsc.chunk_id):
             return
 
-        self._request_chunk_from_device(m.proto.from_device, m.dsc)
+        self._request_chunk_from_device(self._current_sender, m.dsc)
         self._ongoing_upgrade.last_progress = self._clock.now
 
     def on_request_message(self, m: RequestMessage):
@@ -116,8 +139,8 @@ class Device:
         if m.dsc.version == self.running_firmware.version:
             if not self.running_firmware.is_chunk_present(m.dsc.chunk_id):
                 return
-            self._send_data(m.dsc, m.proto.from_device, self.running_firmware.data[m.dsc.chunk_id])
-            self._announce_next_chunk_to_device(m.dsc, m.proto.from_device, self.running_firmware)
+            self._send_data(m.dsc, self._current_sender, self.running_firmware.data[m.dsc.chunk_id])
+            self._announce_next_chunk_to_device(m.dsc, self._current_sender, self.running_firmware)
             return
 
         if not self.upgrading:
@@ -130,13 +153,13 @@ class Device:
             if not self._ongoing_upgrade.candidate_firmware.is_valid_chunk_id(m.dsc.chunk_id):
                 return
 
-            self._request_chunk_for_device(m.proto.from_device, m.dsc)
+            self._request_chunk_for_device(self._current_sender, m.dsc)
             self._request_chunk_for_device(self.dev_id, m.dsc)
 
             return
 
-        self._send_data(m.dsc, m.proto.from_device, self._ongoing_upgrade.candidate_firmware.data[m.dsc.chunk_id])
-        self._announce_next_chunk_to_device(m.dsc, m.proto.from_device, self._ongoing_upgrade.candidate_firmware)
+        self._send_data(m.dsc, self._current_sender, self._ongoing_upgrade.candidate_firmware.data[m.dsc.chunk_id])
+        self._announce_next_chunk_to_device(m.dsc, self._current_sender, self._ongoing_upgrade.candidate_firmware)
 
     def on_data_message(self, m: DataMessage):
         if m.dsc.fw_type != self.dev_type:  # this won't happen anytime - handled in on_before_message
@@ -150,12 +173,14 @@ class Device:
                 self._ongoing_upgrade.candidate_firmware.is_chunk_present(m.dsc.chunk_id):
             return
 
-        self._ongoing_upgrade.candidate_firmware.data[m.dsc.chunk_id] = m.data
+        self._ongoing_upgrade.candidate_firmware.set_chunk(m.dsc.chunk_id, m.data)
         self._ongoing_upgrade.last_progress = self._clock.now
+        if self.convergence_tracker is not None:
+            self.convergence_tracker.on_chunk_received()
 
         self._in_flight_requests_store.mark_request_in_flight_for(m.dsc, self.dev_id, in_flight=False)
 
-        self._announce_chunk(m.dsc, exclude_devices=[m.proto.from_device])
+        self._announce_chunk(m.dsc, exclude_device=self._current_sender)
 
         if self._ongoing_upgrade.candidate_firmware.is_complete():
             self._commit_upgrade()
@@ -176,11 +201,26 @@ class Device:
     def periodic_running_firmware_announcer(self):
         if self._clock.now - self._last_periodic_announce > self.periodic_announce:
             r = self.running_firmware
-            proto = Proto(0, Device.CHUNK_SIZE, ceil(r.data_size / Device.CHUNK_SIZE), r.data_size)
+            proto = Proto(Device.CHUNK_SIZE, ceil(r.data_size / Device.CHUNK_SIZE), r.data_size)
 
             self._announce_chunk(ChunkDescriptor(r.fw_type, r.version, 0), proto=proto)
             self._last_periodic_announce = self._clock.now
 
+    def next_event_time(self) -> int:
+        """
+        Earliest time at which tick() does anything, provided that no new message arrives meanwhile
+        Might be in the past if the device has not been ticked for a while
+        """
+        t = self._last_periodic_announce + self.periodic_announce + 1
+        if self.upgrading:
+            t = min(t, self._ongoing_upgrade.last_progress + self.progress_timeout + 1)
+
+        ready = self._input_queue.next_ready_time()
+        if ready is not None:
+            t = min(t, ready)
+
+        return t
+
     def tick(self):
         self.periodic_running_firmware_announcer()
         self.upgrade_process_timeout_handler()
@@ -206,21 +246,25 @@ class Device:
         self._current_message = None
 
     def _init_upgrade(self, fw_type: FWType, version: Version, proto: Proto):
-        self._ongoing_upgrade = OngoingUpgrade(fw_type, version, proto)
+        self._ongoing_upgrade = OngoingUpgrade(fw_type, version, proto, self._firmware_images)
 
     def _commit_upgrade(self):
+        old_version = self.running_firmware.version
         self.running_firmware = self._ongoing_upgrade.candidate_firmware
         self._ongoing_upgrade = None
 
-    def _announce_chunk(self, dsc: ChunkDescriptor, exclude_devices: Optional[List[DeviceId]] = None, proto: Optional[Proto] = None):
+        if self.convergence_tracker is not None:
+            self.convergence_tracker.on_upgrade(self.dev_type, old_version, self.running_firmware.version)
+
+    def _announce_chunk(self, dsc: ChunkDescriptor, exclude_device: Optional[DeviceId] = None, proto: Optional[Proto] = None):
         """
         Sends announce message announcing a chunk described by dsc ChunkDescriptor
-        to all immediate neighbors excluding specified ones
+        to all immediate neighbors but exclude_device
         Does not have any inner guard, thus must be called with care to avoid network congestion
         """
         proto = proto or self._current_message.proto
         m = AnnounceMessage(proto, dsc)
-        self._broadcast_message(m, exclude_devices=exclude_devices)
+        self._broadcast_message(m, exclude_device=exclude_device)
 
     def _announce_chunk_to_device(self, dsc: ChunkDescriptor, device: DeviceId):
         m = AnnounceMessage(self._current_message.proto, dsc)
@@ -234,7 +278,7 @@ class Device:
         """
         next_chunk_id = firmware.get_next_chunk_present(current_dsc.chunk_id)
         if next_chunk_id:
-            self._announce_chunk_to_device(dcs.replace(current_dsc, chunk_id=next_chunk_id), device)
+            self._announce_chunk_to_device(ChunkDescriptor(current_dsc.fw_type, current_dsc.version, next_chunk_id), device)
 
     def _request_chunk_from_device(self, from_device: DeviceId, dsc: ChunkDescriptor):
         in_flight = self._in_flight_requests_store.is_request_in_flight_for_anybody(dsc)
@@ -252,40 +296,39 @@ class Device:
 
         if not in_flight:
             req = RequestMessage(proto, dsc)
-            self._broadcast_message(req, exclude_devices=[for_device])
+            self._broadcast_message(req, exclude_device=for_device)
 
     def _send_data(self, dsc: ChunkDescriptor, device: DeviceId, data: RawData):
         m = DataMessage(self._current_message.proto, dsc, data)
         self._send_message(device, m)
 
     def _try_satisfy_foreign_requests(self, dsc: ChunkDescriptor, data: RawData):
-        reqs = self._in_flight_requests_store.get_requesters(dsc)
+        reqs = self._in_flight_requests_store.pop_requesters_except(dsc, self.dev_id)
+        if not reqs:
+            return
 
         msg = DataMessage(self._current_message.proto, dsc, data)
-        for dst in reqs-{self.dev_id}:
-            self._in_flight_requests_store.mark_request_in_flight_for(dsc, dst, in_flight=False)
-            self._send_message(dst, msg)
+        # iterate in the order of neighbors rather than of the set, which depends on its history (see Simulator.fork)
+        for dst in self.neighbors:
+            if dst in reqs:
+                self._send_message(dst, msg)
 
-    @counted
     def _send_message(self, device_id: DeviceId, msg: AnyMessage):
         queue = self.neighbors[device_id]
         queue.write(msg)
 
-    def _broadcast_message(self, m: AnyMessage, exclude_devices: Optional[List[DeviceId]]):
-        """Sends given message to all immediate neighbors excluding ones specified in exclude_devices"""
-        exclude_devices = exclude_devices or []
+    def _broadcast_message(self, m: AnyMessage, exclude_device: Optional[DeviceId]):
+        """Sends given message to all immediate neighbors but exclude_device"""
+        self._multicast.write(m, exclude_device)
 
-        for device_id in self.neighbors:
-            if device_id in exclude_devices:
-                continue
-            self._send_message(device_id, m)
+    def remove_neighbor(self, dev_id: DeviceId):
+        del self.neighbors[dev_id]
+        self._multicast.remove(dev_id)
 
     def _try_receive_message(self):
         m = self._input_queue.try_read()
         if m is None:
             return None
 
-        dev_id, m = m
-        proto = dcs.replace(m.proto, from_device=dev_id)
-        m = dcs.replace(m, proto=proto)
+        self._current_sender, m = m
         return m
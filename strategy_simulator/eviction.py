@@ -0,0 +1,173 @@
+import random
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional
+
+import numpy as np
+
+
+class EvictionPolicy(ABC):
+    """
+    Chooses which key a full store evicts, the store reports keys being added, removed, looked up (touch)
+    and marked again (refresh, i.e. their expiration has been postponed). All operations are O(1).
+    Randomized policies take the generator they draw from as the rng keyword argument.
+    """
+    randomized: bool = False
+
+    @abstractmethod
+    def add(self, key: Hashable):
+        pass
+
+    @abstractmethod
+    def remove(self, key: Hashable):
+        pass
+
+    def touch(self, key: Hashable):
+        pass
+
+    def refresh(self, key: Hashable):
+        self.touch(key)
+
+    @abstractmethod
+    def victim(self) -> Hashable:
+        pass
+
+    @abstractmethod
+    def reset(self):
+        """Forgets all keys, randomized policies restart their generator from its initial state"""
+
+
+class LRUPolicy(EvictionPolicy):
+    """Evicts the least recently used key"""
+    def __init__(self):
+        self._keys = OrderedDict()
+
+    def add(self, key: Hashable):
+        self._keys[key] = None
+
+    def remove(self, key: Hashable):
+        del self._keys[key]
+
+    def touch(self, key: Hashable):
+        self._keys.move_to_end(key)
+
+    def victim(self) -> Hashable:
+        return next(iter(self._keys))
+
+    def reset(self):
+        self._keys.clear()
+
+
+class EarliestExpiryPolicy(LRUPolicy):
+    """Evicts the key expiring first, i.e. the least recently marked one as the timeout of a store is constant"""
+    def touch(self, key: Hashable):
+        pass
+
+    def refresh(self, key: Hashable):
+        super().touch(key)
+
+
+class LFUPolicy(EvictionPolicy):
+    """
+    Evicts the least frequently used key, the least recently used one of them. Buckets of keys of the same
+    frequency are linked in the order of their frequencies, the first one holds the least frequent keys.
+    """
+    def __init__(self):
+        self._frequencies: Dict[Hashable, int] = {}
+        self._buckets: Dict[int, OrderedDict] = {}
+        self._next: Dict[int, Optional[int]] = {}
+        self._prev: Dict[int, Optional[int]] = {}
+        self._min_frequency: Optional[int] = None
+
+    def add(self, key: Hashable):
+        self._frequencies[key] = 1
+        if 1 not in self._buckets:
+            # no key is less frequent than a new one
+            self._link(1, None)
+        self._buckets[1][key] = None
+
+    def remove(self, key: Hashable):
+        self._unlink(key, self._frequencies.pop(key))
+
+    def touch(self, key: Hashable):
+        f = self._frequencies[key]
+        if f + 1 not in self._buckets:
+            self._link(f + 1, f)
+        self._buckets[f + 1][key] = None
+        self._frequencies[key] = f + 1
+        self._unlink(key, f)
+
+    def victim(self) -> Hashable:
+        return next(iter(self._buckets[self._min_frequency]))
+
+    def reset(self):
+        self._frequencies.clear()
+        self._buckets.clear()
+        self._next.clear()
+        self._prev.clear()
+        self._min_frequency = None
+
+    def _link(self, frequency: int, prev: Optional[int]):
+        """Creates the bucket of the frequency right after the bucket prev (at the front if None)"""
+        nxt = self._next[prev] if prev is not None else self._min_frequency
+        self._buckets[frequency] = OrderedDict()
+        self._prev[frequency] = prev
+        self._next[frequency] = nxt
+        if prev is not None:
+            self._next[prev] = frequency
+        else:
+            self._min_frequency = frequency
+        if nxt is not None:
+            self._prev[nxt] = frequency
+
+    def _unlink(self, key: Hashable, frequency: int):
+        bucket = self._buckets[frequency]
+        del bucket[key]
+        if bucket:
+            return
+
+        del self._buckets[frequency]
+        prev = self._prev.pop(frequency)
+        nxt = self._next.pop(frequency)
+        if prev is not None:
+            self._next[prev] = nxt
+        else:
+            self._min_frequency = nxt
+        if nxt is not None:
+            self._prev[nxt] = prev
+
+
+class RandomPolicy(EvictionPolicy):
+    """
+    Evicts a key chosen uniformly at random by rng, the generator of the store's stream if the simulation
+    uses RNG streams (see SimulationBuilder.with_rng_streams), by the global random otherwise
+    """
+    randomized = True
+
+    def __init__(self, rng: Optional[np.random.Generator] = None):
+        self._rng: Optional[np.random.Generator] = rng
+        self._initial_state = rng.bit_generator.state if rng is not None else None
+        self._keys: List[Hashable] = []
+        self._positions: Dict[Hashable, int] = {}
+
+    def add(self, key: Hashable):
+        self._positions[key] = len(self._keys)
+        self._keys.append(key)
+
+    def remove(self, key: Hashable):
+        pos = self._positions.pop(key)
+        last = self._keys.pop()
+        if last != key:
+            self._keys[pos] = last
+            self._positions[last] = pos
+
+    def victim(self) -> Hashable:
+        if self._rng is None:
+            return self._keys[random.randrange(len(self._keys))]
+        return self._keys[int(self._rng.integers(len(self._keys)))]
+
+    def reset(self):
+        self._keys.clear()
+        self._positions.clear()
+        if self._rng is not None:
+            self._rng.bit_generator.state = self._initial_state
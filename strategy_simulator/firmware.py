@@ -1,5 +1,5 @@
-from dataclasses import dataclass
-from typing import List, Optional
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
 
 FW_TYPE_A = 1
 FW_TYPE_B = 2
@@ -10,42 +10,124 @@ class Firmware:
     fw_type: int
     version: int
     data: List[Optional[int]]
+    # bit i is set iff chunk i is present, kept in sync with data by set_chunk
+    _present: int = field(init=False, repr=False, compare=False, default=0)
+    _missing: int = field(init=False, repr=False, compare=False, default=0)
+    # registered image the chunks are read from instead of data (see FirmwareImages)
+    _image: Optional[Sequence[int]] = field(init=False, repr=False, compare=False, default=None)
+
+    @classmethod
+    def from_image(cls, fw_type: int, version: int, image: Sequence[int]) -> 'Firmware':
+        """Firmware without any chunk whose data, once received, are read from the image shared by all devices"""
+        fw = cls(fw_type, version, [])
+        fw.data = _ImageView(fw, image)
+        fw._image = image
+        fw._missing = len(image)
+        return fw
+
+    def __post_init__(self):
+        present = 0
+        for i, d in enumerate(self.data):
+            if d is not None:
+                present |= 1 << i
+        self._present = present
+        self._missing = len(self.data) - bin(present).count('1')
 
     @property
     def data_size(self):
         return len(self.data)
 
+    @property
+    def chunks_present(self) -> int:
+        return self.data_size - self._missing
+
+    def set_chunk(self, chunk_id: int, chunk: int):
+        if not self.is_chunk_present(chunk_id):
+            self._present |= 1 << chunk_id
+            self._missing -= 1
+        if self._image is None:
+            self.data[chunk_id] = chunk
+
     def is_complete(self):
-        return not any([d is None for d in self.data])
+        return self._missing == 0
 
     def is_chunk_present(self, chunk_id: int):
         if not self.is_valid_chunk_id(chunk_id):
             return False
 
-        return self.data[chunk_id] is not None
+        return (self._present >> chunk_id) & 1 == 1
 
     def is_valid_chunk_id(self, chunk_id: int):
         return 0 <= chunk_id < self.data_size
 
     def get_missing_chunks(self):
-        return list(
-            map(
-                lambda x: x[0],
-                filter(
-                    lambda x: x[1],
-                    enumerate([
-                        d is None for d in self.data
-                    ])
-                )
-            )
-        )
+        missing = self._missing_mask()
+        chunks = []
+        while missing:
+            lowest = missing & -missing
+            chunks.append(lowest.bit_length() - 1)
+            missing ^= lowest
+        return chunks
 
     def get_first_missing_chunk(self):
-        return self.get_missing_chunks()[0]
+        missing = self._missing_mask()
+        if missing == 0:
+            raise IndexError("No chunk is missing")
+        return (missing & -missing).bit_length() - 1
 
     def get_next_chunk_present(self, chunk_id: int):
-        for i in range(chunk_id + 1, self.data_size):  # pozor tady musi byt +1 jinak se nehybeme dal
-            if self.data[i] is not None:
-                return i
+        following = self._present >> (chunk_id + 1)
+        if following == 0:
+            return None
+        return chunk_id + (following & -following).bit_length()
+
+    def _missing_mask(self) -> int:
+        return ~self._present & ((1 << self.data_size) - 1)
+
+
+class _ImageView(Sequence):
+    """Data of a firmware sharing a registered image: chunk i of the image if the firmware has it, None otherwise"""
+    __slots__ = ('_firmware', '_image')
+
+    def __init__(self, firmware: Firmware, image: Sequence[int]):
+        self._firmware = firmware
+        self._image = image
+
+    def __len__(self) -> int:
+        return len(self._image)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._image[i] if self._firmware.is_chunk_present(i) else None
+
+
+class FirmwareImages:
+    """
+    Registry of payloads of complete firmwares of a simulation, stored once per (fw_type, version).
+    Devices upgrading to a registered firmware keep only the presence of its chunks and read the data
+    from the image, since all copies of a firmware carry the same data.
+    """
+    def __init__(self):
+        self._images: Dict[Tuple[int, int], Sequence[int]] = {}
+
+    def register(self, firmware: Firmware):
+        if firmware.is_complete():
+            self._images.setdefault((firmware.fw_type, firmware.version), firmware.data)
+
+    def images(self) -> List[Sequence[int]]:
+        return list(self._images.values())
+
+    def get(self, fw_type: int, version: int) -> Optional[Sequence[int]]:
+        return self._images.get((fw_type, version))
 
-        return None
+    def empty_firmware(self, fw_type: int, version: int, chunks: int) -> Firmware:
+        """Firmware with none of its chunks, backed by the registered image if there is one of the same size"""
+        image = self.get(fw_type, version)
+        if image is None or len(image) != chunks:
+            return Firmware(fw_type, version, [None] * chunks)
+        return Firmware.from_image(fw_type, version, image)
@@ -1,13 +1,75 @@
-from random import choices
-from typing import Any, List, Optional, Tuple
+import random
+from copy import copy, deepcopy
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
 
 from .clock import ClockView
 from .bounded_queue import BoundedQueue
+from .metrics import EVENT_NAMES, LOST, OVERFLOWED, RECEIVED, SENT
+
+
+class LossSampler:
+    """
+    Hands out delivery outcomes of messages of a link drawn from the link's own stream, uniform variates are drawn
+    in blocks and each message is delivered iff its variate is lower than the reliability. Blocks start small
+    and double up to MAX_BLOCK_SIZE, thus links which rarely send hold just a few variates.
+    """
+    MIN_BLOCK_SIZE: int = 16
+    MAX_BLOCK_SIZE: int = 1024
+
+    def __init__(self, rng: np.random.Generator):
+        self._rng: np.random.Generator = rng
+        self._initial_state = rng.bit_generator.state
+        self._block: np.ndarray = _NO_VARIATES
+        self._block_state = None  # state of the generator the block has been drawn from
+        self._pos: int = 0
+
+    def delivered(self, reliability: float) -> bool:
+        if self._pos == len(self._block):
+            size = min(max(2 * len(self._block), self.MIN_BLOCK_SIZE), self.MAX_BLOCK_SIZE)
+            self._block_state = self._rng.bit_generator.state
+            self._block = self._rng.random(size)
+            self._pos = 0
+
+        u = self._block.item(self._pos)
+        self._pos += 1
+        return u < reliability
+
+    def reset(self):
+        self._rng.bit_generator.state = self._initial_state
+        self._block = _NO_VARIATES
+        self._block_state = None
+        self._pos = 0
+
+    def __deepcopy__(self, memo):
+        c = copy(self)
+        c._rng = deepcopy(self._rng, memo)
+        c._block = self._block.copy()  # cheaper than drawing it again
+        return c
+
+    def __getstate__(self):
+        # the block is drawn again when unpickled instead of being stored
+        state = self.__dict__.copy()
+        state['_block'] = len(self._block)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        size = self._block
+        self._block = _NO_VARIATES
+        if self._block_state is not None:
+            self._rng.bit_generator.state = self._block_state
+            self._block = self._rng.random(size)
+
+
+_NO_VARIATES = np.empty(0)
 
 
 class WriteQueue:
     def __init__(self, write_queue, writer_id: Any, clock: ClockView, write_reliability: float = 1.0,
-                 debug: bool = False):
+                 debug: bool = False, rng: Optional[np.random.Generator] = None):
         self._write_queue = write_queue
         self._clock: ClockView = clock
         self.writer_id: Any = writer_id
@@ -15,10 +77,29 @@ class WriteQueue:
         self.debug: bool = debug
         self._lost_messages: List[Any] = []
         self._sent_messages: List[Any] = []
-        self._overflowed_messages: List[Tuple[int, Any]] = []
+        self._overflowed_messages: List[Tuple[Any, Any]] = []  # (writer_id, message) items dropped by the queue
+        # loss decisions are drawn from the link's own stream if given (see rng.link_stream), else from random
+        # which all links of the process share
+        self._sampler: Optional[LossSampler] = LossSampler(rng) if rng is not None else None
+        self._counters: Optional[array] = None  # see metrics.MessageCounters
+        self._counters_base: int = 0
 
     def write(self, o: Any):
-        success = choices([True, False], [self.write_reliability, 1.0 - self.write_reliability], k=1)[0]
+        success = self.deliver(o, (self.writer_id, o))
+        if self._counters is not None:
+            self._counters[self._counters_base + o.KIND * len(EVENT_NAMES) + (SENT if success else LOST)] += 1
+
+    def deliver(self, o: Any, item: Tuple[Any, Any]) -> bool:
+        """
+        Decides whether the message o is lost and queues the item (writer_id, o) if not, returns whether it has
+        been sent. Only overflows are counted, sending and losing the message is counted by the caller.
+        """
+        if self.write_reliability == 1.0:
+            success = True
+        elif self._sampler is None:
+            success = random.random() < self.write_reliability
+        else:
+            success = self._sampler.delivered(self.write_reliability)
 
         if self.debug:
             if success:
@@ -27,9 +108,60 @@ class WriteQueue:
                 self._lost_messages.append(o)
 
         if success:
-            overflow = self._write_queue.push((self.writer_id, o))
-            if self.debug and overflow is not None:
-                self._overflowed_messages.append(overflow)
+            overflow = self._write_queue.push(item)
+            if overflow is not None:
+                if self.debug:
+                    self._overflowed_messages.append(overflow)
+                if self._counters is not None:
+                    self._counters[self._counters_base + overflow[1].KIND * len(EVENT_NAMES) + OVERFLOWED] += 1
+        return success
+
+    def count_into(self, counters: Optional[array], base: int = 0):
+        self._counters = counters
+        self._counters_base = base
+
+    def reset(self):
+        self._lost_messages.clear()
+        self._sent_messages.clear()
+        self._overflowed_messages.clear()
+        if self._sampler is not None:
+            self._sampler.reset()
+
+
+class MulticastGroup:
+    """
+    Write queues of all neighbors of a writer, a message written to the group is queued once per recipient
+    as the same (writer_id, message) item and counted once per write. Each link draws its own loss decision
+    (from its own stream), one by one, as drawing them at once would tie the streams of the links together.
+    """
+    def __init__(self, writer_id: Any, queues: Dict[Any, WriteQueue]):
+        self.writer_id: Any = writer_id
+        self._members: List[Tuple[Any, WriteQueue]] = list(queues.items())
+        self._counters: Optional[array] = None  # the writer's slot, see metrics.MessageCounters
+        self._counters_base: int = 0
+
+    def write(self, o: Any, exclude: Any = None):
+        """Writes the message into queues of all members but exclude"""
+        item = (self.writer_id, o)
+        sent = lost = 0
+        for dst, queue in self._members:
+            if dst != exclude:
+                if queue.deliver(o, item):
+                    sent += 1
+                else:
+                    lost += 1
+
+        if self._counters is not None:
+            base = self._counters_base + o.KIND * len(EVENT_NAMES)
+            self._counters[base + SENT] += sent
+            self._counters[base + LOST] += lost
+
+    def remove(self, dst: Any):
+        self._members = [(d, q) for d, q in self._members if d != dst]
+
+    def count_into(self, counters: Optional[array], base: int = 0):
+        self._counters = counters
+        self._counters_base = base
 
 
 class ReadQueue:
@@ -38,14 +170,31 @@ class ReadQueue:
         self.debug: bool = debug
         self._q: BoundedQueue = BoundedQueue(self._clock, maxlen=maxlen)
         self._received_messages: List[Any] = []
+        self._counters: Optional[array] = None  # see metrics.MessageCounters
+        self._counters_base: int = 0
 
     def write_queue_for_writer(self, writer_id: Any, write_reliability: float = 1.0,
-                               debug: Optional[bool] = None) -> WriteQueue:
+                               debug: Optional[bool] = None, rng: Optional[np.random.Generator] = None) -> WriteQueue:
         debug = debug or self.debug
-        return WriteQueue(self._q, writer_id, self._clock, write_reliability, debug)
+        return WriteQueue(self._q, writer_id, self._clock, write_reliability, debug, rng)
+
+    def reset(self):
+        """Drops queued messages and clears stats, write queues of the writers are reset by their owners"""
+        self._q.reset()
+        self._received_messages.clear()
 
     def try_read(self) -> Optional[Tuple[Any, Any]]:
         m = self._q.pop()
-        if self.debug and m is not None:
-            self._received_messages.append(m)
+        if m is not None:
+            if self.debug:
+                self._received_messages.append(m)
+            if self._counters is not None:
+                self._counters[self._counters_base + m[1].KIND * len(EVENT_NAMES) + RECEIVED] += 1
         return m
+
+    def count_into(self, counters: Optional[array], base: int = 0):
+        self._counters = counters
+        self._counters_base = base
+
+    def next_ready_time(self) -> Optional[int]:
+        return self._q.next_ready_time()
@@ -2,7 +2,7 @@ import networkx as nx
 
 from .firmware import FW_TYPE_A, Firmware, FW_TYPE_B
 from .simulator import SimulationBuilder, watcher
-from .utils import general_stopping_condition
+from .utils import tracked_stopping_condition
 
 fw_size = 10
 grid_size = (3, 3)
@@ -22,5 +22,5 @@ sb.with_default_link_reliability(1.0)
 sb.from_networkx_graph(graph)
 s = sb.build()
 # s.attach_watcher(watcher(blocking=True, clean_screen=True, print_dev_progress=True))
-s.run_until(lambda x: general_stopping_condition(x, dev_type=None))
+s.run_until(tracked_stopping_condition(s, dev_type=None))
 print(s.clock.now)
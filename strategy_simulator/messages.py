@@ -1,49 +1,124 @@
-import typing
-from dataclasses import dataclass
-from typing import Union
-
-if typing.TYPE_CHECKING:
-    from .device import DeviceId
-
+from typing import Dict, NamedTuple, Tuple, Union
 
 RawData = int
 FWType = int
 Version = int
 ChunkId = int
 
+# Messages are plain fixed-layout tuples, the sender is not part of a message, it travels next to it
+# in the queues (see WriteQueue.write) and is known to the receiving device as Device._current_sender.
+# Being immutable, they are shared instead of copied by deepcopy (e.g. Simulator.fork).
+# KIND indexes the message type in counters (see metrics.MessageCounters) and in the vectorized engine.
+ANNOUNCE = 0
+REQUEST = 1
+DATA = 2
+
+
+def _shared(self, *_):
+    return self
+
+
+def _immutable(self, *_):
+    raise AttributeError(f"{type(self).__name__} is immutable")
+
+
+# messages of different types are never equal even though their fields are, e.g. an announce and a request
+# of the same chunk
+def _eq(self, other):
+    return type(self) is type(other) and tuple.__eq__(self, other)
+
+
+def _ne(self, other):
+    return not _eq(self, other)
+
+
+def _hash(self):
+    return hash((self.KIND, tuple.__hash__(self)))
+
 
-@dataclass(frozen=True, eq=True)
 class ChunkDescriptor:
-    fw_type: FWType
-    version: Version
-    chunk_id: ChunkId
+    """
+    Interned, i.e. there is a single instance per (fw_type, version, chunk_id) in a process, thus descriptors
+    are compared and hashed by identity which is what makes them cheap keys of the stores. Immutable, as modifying
+    the shared instance would modify every message and store key referring to it.
+    """
+    __slots__ = ('fw_type', 'version', 'chunk_id')
+    _instances: Dict[Tuple[FWType, Version, ChunkId], 'ChunkDescriptor'] = {}
+
+    def __new__(cls, fw_type: FWType, version: Version, chunk_id: ChunkId) -> 'ChunkDescriptor':
+        key = (fw_type, version, chunk_id)
+        dsc = cls._instances.get(key)
+        if dsc is None:
+            dsc = object.__new__(cls)
+            object.__setattr__(dsc, 'fw_type', fw_type)
+            object.__setattr__(dsc, 'version', version)
+            object.__setattr__(dsc, 'chunk_id', chunk_id)
+            cls._instances[key] = dsc
+        return dsc
+
+    def __reduce__(self):
+        return ChunkDescriptor, (self.fw_type, self.version, self.chunk_id)
+
+    def __repr__(self):
+        return f"ChunkDescriptor(fw_type={self.fw_type}, version={self.version}, chunk_id={self.chunk_id})"
+
+    __copy__ = __deepcopy__ = _shared
+    __setattr__ = __delattr__ = _immutable
 
 
-@dataclass(frozen=True, eq=True)
 class Proto:
-    from_device: 'DeviceId'
-    chunk_size: int  # size of a typical chunk
-    chunks: int  # total number of chunks
-    fw_size: int  # firmware size in bytes
+    """Interned the same way as ChunkDescriptor"""
+    __slots__ = ('chunk_size', 'chunks', 'fw_size')
+    _instances: Dict[Tuple[int, int, int], 'Proto'] = {}
+
+    def __new__(cls, chunk_size: int, chunks: int, fw_size: int) -> 'Proto':
+        key = (chunk_size, chunks, fw_size)
+        proto = cls._instances.get(key)
+        if proto is None:
+            proto = object.__new__(cls)
+            object.__setattr__(proto, 'chunk_size', chunk_size)  # size of a typical chunk
+            object.__setattr__(proto, 'chunks', chunks)  # total number of chunks
+            object.__setattr__(proto, 'fw_size', fw_size)  # firmware size in bytes
+            cls._instances[key] = proto
+        return proto
 
+    def __reduce__(self):
+        return Proto, (self.chunk_size, self.chunks, self.fw_size)
 
-@dataclass(frozen=True, eq=True)
-class AnnounceMessage:
+    def __repr__(self):
+        return f"Proto(chunk_size={self.chunk_size}, chunks={self.chunks}, fw_size={self.fw_size})"
+
+    __copy__ = __deepcopy__ = _shared
+    __setattr__ = __delattr__ = _immutable
+
+
+class AnnounceMessage(NamedTuple):
     proto: Proto
     dsc: ChunkDescriptor
 
+    KIND = ANNOUNCE
+    __deepcopy__ = _shared
+    __eq__, __ne__, __hash__ = _eq, _ne, _hash
 
-@dataclass(frozen=True, eq=True)
-class RequestMessage:
+
+class RequestMessage(NamedTuple):
     proto: Proto
     dsc: ChunkDescriptor
 
+    KIND = REQUEST
+    __deepcopy__ = _shared
+    __eq__, __ne__, __hash__ = _eq, _ne, _hash
+
 
-@dataclass(frozen=True, eq=True)
-class DataMessage:
+class DataMessage(NamedTuple):
     proto: Proto
     dsc: ChunkDescriptor
     data: RawData
 
+    KIND = DATA
+    __deepcopy__ = _shared
+    __eq__, __ne__, __hash__ = _eq, _ne, _hash
+
 
 AnyMessage = Union[AnnounceMessage, RequestMessage, DataMessage]
+MESSAGE_TYPES = (AnnounceMessage, RequestMessage, DataMessage)  # in the order of their kinds
@@ -1,32 +1,54 @@
 import typing
-from functools import wraps
-
-if typing.TYPE_CHECKING:
-    from .device import Device, AnyMessage
-
-
-def _count_sent_messages(device: 'Device', msg: 'AnyMessage'):
-    sent_messages = device._stats.setdefault('sent_messages', {})
-    msg_type = str(type(msg))
-    sent_messages[msg_type] = sent_messages.get(msg_type, 0) + 1
+from array import array
+from typing import Iterable
 
+import numpy as np
 
-def counted(method):
-    @wraps(method)
-    def _impl(self: 'Device', *args, **kwargs):
-        m_name = method.__name__
-        if m_name in _COUNTER_IMPLS:
-            _COUNTER_IMPLS[m_name](self, *args, **kwargs)
-        else:
-            stats = self._stats
-            label = method.__name__
-            stats[label] = stats.get(label, 0) + 1
+from .messages import MESSAGE_TYPES
 
-        method(self, *args, **kwargs)
-
-    return _impl
-
-
-_COUNTER_IMPLS = {
-    'send_message': _count_sent_messages
-}
+if typing.TYPE_CHECKING:
+    from .device import Device
+
+# events counted per device and message kind, sent (delivered into the reader's queue), lost and overflowed
+# are counted at the writer, received at the reader
+SENT = 0
+LOST = 1
+OVERFLOWED = 2
+RECEIVED = 3
+EVENT_NAMES = ('sent', 'lost', 'overflowed', 'received')
+
+
+class MessageCounters:
+    """
+    Preallocated int64 counters indexed by [device, message kind, event], devices in the order in which they have
+    been tracked, message kinds as messages' KIND. Queues of tracked devices count into them, queues of untracked
+    ones just skip counting.
+    """
+    def __init__(self, num_devices: int):
+        self.num_devices: int = num_devices
+        self._counts: array = array('q', bytes(8 * num_devices * len(MESSAGE_TYPES) * len(EVENT_NAMES)))
+
+    def track(self, devices: Iterable['Device']):
+        """Subscribes queues of the devices, the i-th device counts into [i]"""
+        for i, d in enumerate(devices):
+            base = i * len(MESSAGE_TYPES) * len(EVENT_NAMES)
+            d._input_queue.count_into(self._counts, base)
+            d._multicast.count_into(self._counts, base)
+            for q in d.neighbors.values():
+                q.count_into(self._counts, base)
+
+    @staticmethod
+    def untrack(devices: Iterable['Device']):
+        for d in devices:
+            d._input_queue.count_into(None)
+            d._multicast.count_into(None)
+            for q in d.neighbors.values():
+                q.count_into(None)
+
+    def clear(self):
+        self.to_numpy()[:] = 0
+
+    def to_numpy(self) -> np.ndarray:
+        """Counters as a (devices, message kinds, events) array, a view, i.e. it changes as the simulation runs"""
+        return np.frombuffer(self._counts, dtype=np.int64).reshape(self.num_devices, len(MESSAGE_TYPES),
+                                                                    len(EVENT_NAMES))
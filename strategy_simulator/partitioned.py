@@ -0,0 +1,208 @@
+import multiprocessing as mp
+import random
+from collections import deque
+from math import ceil
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import networkx as nx
+import numpy as np
+
+from .clock import Clock, ClockView
+from .device import Device, DeviceId
+from .iqueue import ReadQueue, WriteQueue
+from .simulator import Simulator, SimulationBuilder
+
+Partition = Dict[Any, int]
+QueuedMessage = Tuple[DeviceId, Tuple[DeviceId, Any]]
+
+
+def partition_graph(graph: nx.Graph, parts: int) -> Partition:
+    """
+    Splits nodes into parts of (almost) equal size by cutting the breadth first order of the graph,
+    which keeps the parts contiguous on grids and radial topologies
+    """
+    order = []
+    seen = set()
+    for start in graph.nodes:
+        if start in seen:
+            continue
+        seen.add(start)
+        q = deque([start])
+        while q:
+            node = q.popleft()
+            order.append(node)
+            for n in graph.adj[node]:
+                if n not in seen:
+                    seen.add(n)
+                    q.append(n)
+
+    size = ceil(len(order) / parts)
+    return {node: i // size for i, node in enumerate(order)}
+
+
+class _DeferredQueue:
+    """
+    Stands in for the input queue of a device (local or remote) inside a partition worker,
+    messages written into it are collected and pushed into the real queue at the end of the tick
+    """
+    def __init__(self, reader_id: DeviceId, clock: ClockView, outbox: List[QueuedMessage], debug: bool = False):
+        self.reader_id: DeviceId = reader_id
+        self._clock: ClockView = clock
+        self._outbox: List[QueuedMessage] = outbox
+        self.debug: bool = debug
+
+    def write_queue_for_writer(self, writer_id: Any, write_reliability: float = 1.0,
+                               debug: Optional[bool] = None, rng: Optional[np.random.Generator] = None) -> WriteQueue:
+        debug = debug or self.debug
+        return WriteQueue(self, writer_id, self._clock, write_reliability, debug, rng)
+
+    def push(self, item: Tuple[DeviceId, Any]):
+        self._outbox.append((self.reader_id, item))
+
+
+class _PartitionWorker:
+    def __init__(self, conn, builder: SimulationBuilder, part: int, owners: List[int], seed: int):
+        random.seed(seed)
+        self._conn = conn
+        self._part: int = part
+        self._owners: List[int] = owners
+        self._clock = Clock()
+        self._outbox: List[QueuedMessage] = []
+
+        cv = self._clock.clock_view()
+        labels = list(builder._graph.nodes)
+        own_labels = {label for i, label in enumerate(labels) if owners[i] == part}
+        input_queues = {label: ReadQueue(cv, builder._debug) for label in own_labels}
+        neighbor_queues = {label: _DeferredQueue(i, cv, self._outbox, builder._debug) for i, label in enumerate(labels)}
+        self.devices: List[Device] = builder._build_devices(cv, input_queues, neighbor_queues, own_labels)
+        self._devices_by_id: Dict[DeviceId, Device] = {d.dev_id: d for d in self.devices}
+
+    def serve(self):
+        while True:
+            cmd, arg = self._conn.recv()
+            if cmd == 'run_until':
+                self._run_until(arg)
+            elif cmd == 'run_for':
+                start_at = self._clock.now
+                self._run_until(lambda _: self._clock.now - start_at >= arg)
+            elif cmd == 'collect':
+                self._conn.send(self.devices)
+            elif cmd == 'close':
+                return
+
+    def _run_until(self, stop_condition: Callable[[List[Device]], bool]):
+        while True:
+            self._conn.send(stop_condition(self.devices))
+            if not self._conn.recv():
+                return
+
+            for d in self.devices:
+                d.tick()
+
+            local = []
+            remote: Dict[int, List[QueuedMessage]] = {}
+            for m in self._outbox:
+                owner = self._owners[m[0]]
+                if owner == self._part:
+                    local.append(m)
+                else:
+                    remote.setdefault(owner, []).append(m)
+            self._outbox.clear()
+
+            self._conn.send(remote)
+            inbound = local + self._conn.recv()
+            self._deliver(inbound)
+            self._clock.tick()
+
+    def _deliver(self, inbound: List[QueuedMessage]):
+        """
+        Pushes messages in the order of a single process run, i.e. by writer id, each writer's messages in order
+        in which they were sent
+        """
+        inbound.sort(key=lambda m: m[1][0])
+        for reader_id, item in inbound:
+            self._devices_by_id[reader_id]._input_queue._q.push(item)
+
+
+def _partition_worker_main(conn, builder: SimulationBuilder, part: int, owners: List[int], seed: int):
+    _PartitionWorker(conn, builder, part, owners, seed).serve()
+
+
+class PartitionedSimulator:
+    """
+    Simulates a single network split into partitions, each partition's devices run in a separate worker process.
+    Messages are exchanged between the workers in bulk at the end of every tick.
+
+    Devices are ticked in the order of their ids thus, as long as no random decision influences the run
+    (all links are reliable) or the builder uses RNG streams (with_rng_streams), the run is identical
+    to the one of Simulator without shuffling.
+    Input queues' max used sizes are approximate though, they might be lower by one: in a single process run a device
+    reads its message in between of writes of devices with lower and higher ids, here after all of them.
+    Stop conditions are evaluated on each partition's devices and the run stops when all partitions agree,
+    they must therefore be conjunctive (like general_stopping_condition) and picklable.
+    Bounded queues are not supported.
+    """
+    def __init__(self, builder: SimulationBuilder, parts: int, partition: Optional[Partition] = None,
+                 seed: Optional[int] = None):
+        if builder._queues_max_len is not None:
+            raise ValueError("Bounded queues are not supported by PartitionedSimulator")
+
+        partition = partition or partition_graph(builder._graph, parts)
+        labels = list(builder._graph.nodes)
+        owners = [partition[label] for label in labels]
+        seed = seed if seed is not None else random.getrandbits(32)
+
+        self._clock = Clock()
+        self.clock = self._clock.clock_view()
+        self._conns = []
+        self._workers = []
+        for part in sorted(set(owners)):
+            parent, child = mp.Pipe()
+            w = mp.Process(target=_partition_worker_main, args=(child, builder, part, owners, seed + part), daemon=True)
+            w.start()
+            self._conns.append((part, parent))
+            self._workers.append(w)
+
+    def run_for(self, ticks: int):
+        self._run(('run_for', ticks))
+
+    def run_until(self, stop_condition: Callable[[List[Device]], bool]):
+        self._run(('run_until', stop_condition))
+
+    def collect(self) -> Simulator:
+        """Gathers devices from the workers into a Simulator for inspection (e.g. by extract_stats)"""
+        for _, conn in self._conns:
+            conn.send(('collect', None))
+        devices = sorted((d for _, conn in self._conns for d in conn.recv()), key=lambda d: d.dev_id)
+        return Simulator(Clock(self._clock.now), devices)
+
+    def close(self):
+        for _, conn in self._conns:
+            conn.send(('close', None))
+        for w in self._workers:
+            w.join()
+        self._conns = []
+        self._workers = []
+
+    def __enter__(self) -> 'PartitionedSimulator':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _run(self, cmd: Tuple[str, Any]):
+        for _, conn in self._conns:
+            conn.send(cmd)
+
+        while True:
+            done = [conn.recv() for _, conn in self._conns]
+            go_on = not all(done)
+            for _, conn in self._conns:
+                conn.send(go_on)
+            if not go_on:
+                return
+
+            outboxes = [conn.recv() for _, conn in self._conns]
+            for part, conn in self._conns:
+                conn.send([m for outbox in outboxes for m in outbox.get(part, ())])
+            self._clock.tick()
@@ -0,0 +1,189 @@
+import multiprocessing as mp
+import random
+from dataclasses import dataclass, field
+from math import sqrt
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from scipy import stats
+
+from .rng import seed_streams
+from .simulator import Simulator, SimulationBuilder
+from .test_utils import Stats, extract_stats
+from .utils import tracked_stopping_condition
+
+DEFAULT_SEED = 123456789
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """
+    Picklable description of a simulation run, i.e. a module level function building and running the simulation
+    (like test_utils.grid_single_type) together with its keyword arguments
+    """
+    factory: Callable[..., Simulator]
+    kwargs: Dict[str, Any] = field(default_factory=lambda: dict())
+
+    def run(self) -> Simulator:
+        return self.factory(**self.kwargs)
+
+
+@dataclass(frozen=True)
+class Variant:
+    """
+    Picklable variant of a protocol for paired comparisons (see compare_variants): a module level function creating
+    a SimulationBuilder (like test_utils.grid_single_type_builder) with its keyword arguments and options of
+    the builder, e.g. {'periodic_announce': 50} calls with_periodic_announce(50).
+    The simulation draws from RNG streams and runs until convergence.
+    """
+    builder_factory: Callable[..., SimulationBuilder]
+    kwargs: Dict[str, Any] = field(default_factory=lambda: dict())
+    options: Dict[str, Any] = field(default_factory=lambda: dict())
+    dev_type: Optional[int] = None
+    shuffle: bool = True
+
+    def run(self) -> Simulator:
+        sb = self.builder_factory(**self.kwargs)
+        for name, value in self.options.items():
+            getattr(sb, f'with_{name}')(value)
+        s = sb.with_rng_streams().build()
+        s.shuffle = self.shuffle
+        s.run_until(tracked_stopping_condition(s, dev_type=self.dev_type))
+        return s
+
+
+@dataclass
+class PairedComparison:
+    """Differences of a metric between a variant and the baseline in paired replicates"""
+    baseline: str
+    variant: str
+    differences: List[float]
+    mean: float
+    ci_low: float
+    ci_high: float
+    confidence: float
+
+
+Runnable = Union[Scenario, Variant]
+
+
+@dataclass
+class AdaptiveEstimate:
+    """Mean of a metric over the replicates actually run with its t-based confidence interval"""
+    mean: float
+    ci_low: float
+    ci_high: float
+    confidence: float
+    replicates: int
+    values: List[float]
+
+
+def replicate_seed(seed: int, replicate: int) -> int:
+    """
+    Seed of the global random of the replicate, derived from the replicate-th child of SeedSequence(seed)
+    (as spawned by SeedSequence.spawn), thus replicates of different base seeds never share a seed
+    """
+    state = np.random.SeedSequence(seed, spawn_key=(replicate,)).generate_state(4)
+    return int.from_bytes(state.tobytes(), 'little')
+
+
+def _run_replicate(args: Tuple[Runnable, int, int]) -> Stats:
+    scenario, seed, replicate = args
+    random.seed(replicate_seed(seed, replicate))
+    seed_streams(seed, replicate)
+    return extract_stats(scenario.run())
+
+
+def iter_replicates(scenario: Runnable, replicates: int, seed: int = DEFAULT_SEED, processes: Optional[int] = None,
+                    chunk_size: int = 1) -> Iterator[List[Stats]]:
+    """
+    Runs replicates of the scenario in a pool of processes (one per CPU by default), replicate i seeded
+    by replicate_seed(seed, i) (and seed_streams(seed, i) for builders using RNG streams), and yields their stats
+    in chunks of chunk_size in the order of the replicates as soon as each chunk is complete
+    """
+    tasks = [(scenario, seed, i) for i in range(replicates)]
+
+    if processes == 1:
+        results = map(_run_replicate, tasks)
+        yield from _chunked(results, chunk_size)
+        return
+
+    with mp.Pool(processes) as pool:
+        results = pool.imap(_run_replicate, tasks, chunksize=chunk_size)
+        yield from _chunked(results, chunk_size)
+
+
+def run_replicates(scenario: Runnable, replicates: int, seed: int = DEFAULT_SEED,
+                   processes: Optional[int] = None) -> List[Stats]:
+    """Parallel counterpart of [extract_stats(s) for s in repeated(simulation_factory, replicates)]"""
+    return [s for chunk in iter_replicates(scenario, replicates, seed, processes) for s in chunk]
+
+
+def parallel_avg_runtime(scenario: Runnable, replicates: int, seed: int = DEFAULT_SEED,
+                         processes: Optional[int] = None) -> float:
+    """Parallel counterpart of test_utils.avg_runtime"""
+    vals = [s.runtime for s in run_replicates(scenario, replicates, seed, processes)]
+    return sum(vals) / replicates
+
+
+def compare_variants(variants: Dict[str, Variant], replicates: int, seed: int = DEFAULT_SEED,
+                     confidence: float = 0.95, metric: Callable[[Stats], float] = lambda s: s.runtime,
+                     processes: Optional[int] = None) -> List[PairedComparison]:
+    """
+    Compares each variant to the first one using common random numbers: replicate i of every variant sees
+    the same link losses and shuffle orders (the same RNG streams), thus the noise shared by the variants cancels
+    out in their paired differences. Confidence intervals of the mean differences are t-based.
+    """
+    names = list(variants)
+    values = {
+        name: [metric(s) for s in run_replicates(variants[name], replicates, seed, processes)] for name in names
+    }
+
+    baseline = names[0]
+    comparisons = []
+    for name in names[1:]:
+        diffs = [v - b for v, b in zip(values[name], values[baseline])]
+        mean, half_width = _mean_ci(diffs, confidence)
+        comparisons.append(PairedComparison(baseline, name, diffs, mean, mean - half_width, mean + half_width,
+                                            confidence))
+    return comparisons
+
+
+def adaptive_replicates(scenario: Runnable, rel_half_width: float = 0.05, confidence: float = 0.95,
+                        min_replicates: int = 5, max_replicates: int = 100,
+                        metric: Callable[[Stats], float] = lambda s: s.runtime, seed: int = DEFAULT_SEED,
+                        processes: Optional[int] = None) -> AdaptiveEstimate:
+    """
+    Runs replicates (seeded as by iter_replicates) until the half width of the confidence interval of the mean
+    of the metric falls to rel_half_width of the mean, at least min_replicates and at most max_replicates of them
+    """
+    values = []
+    mean, half_width = 0.0, float('inf')
+    for chunk in iter_replicates(scenario, max_replicates, seed, processes):
+        values.extend(metric(s) for s in chunk)
+        mean, half_width = _mean_ci(values, confidence)
+        if len(values) >= min_replicates and half_width <= rel_half_width * abs(mean):
+            break
+
+    return AdaptiveEstimate(mean, mean - half_width, mean + half_width, confidence, len(values), values)
+
+
+def _mean_ci(values: List[float], confidence: float) -> Tuple[float, float]:
+    """Mean of the values and half width of its t-based confidence interval"""
+    n = len(values)
+    mean = sum(values) / n
+    if n < 2:
+        return mean, float('inf')
+    sd = sqrt(sum((v - mean) ** 2 for v in values) / (n - 1))
+    return mean, stats.t.ppf((1 + confidence) / 2, n - 1) * sd / sqrt(n)
+
+
+def _chunked(results, chunk_size: int) -> Iterator[List[Stats]]:
+    chunk = []
+    for r in results:
+        chunk.append(r)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,50 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+# kinds of streams of a replicate, part of the stream's path
+LINK = 0
+SCHEDULER = 1
+STORE = 2
+
+_master_seed: Optional[int] = None
+_replicate: int = 0
+
+
+def seed_streams(master_seed: int, replicate: int = 0):
+    """
+    Sets the master seed (and the replicate) used by builders with_rng_streams() without explicit ones,
+    the streams counterpart of setup_rng
+    """
+    global _master_seed, _replicate
+    _master_seed = master_seed
+    _replicate = replicate
+
+
+def default_streams() -> Tuple[int, int]:
+    if _master_seed is None:
+        raise ValueError("No master seed, call seed_streams first or give it explicitly")
+    return _master_seed, _replicate
+
+
+def stream(master_seed: int, *path: int) -> np.random.Generator:
+    """
+    Independent counter based (Philox) stream identified by its path, e.g. (replicate, LINK, writer, reader)
+    Streams depend only on the master seed and the path, not on the order in which they are created or used.
+    """
+    return np.random.Generator(np.random.Philox(np.random.SeedSequence(master_seed, spawn_key=path)))
+
+
+def link_stream(master_seed: int, replicate: int, writer_id: int, reader_id: int) -> np.random.Generator:
+    """Stream of loss decisions of messages sent by writer_id to reader_id"""
+    return stream(master_seed, replicate, LINK, writer_id, reader_id)
+
+
+def scheduler_stream(master_seed: int, replicate: int) -> np.random.Generator:
+    """Stream of the order in which devices are ticked"""
+    return stream(master_seed, replicate, SCHEDULER)
+
+
+def store_stream(master_seed: int, replicate: int, dev_id: int, store: int) -> np.random.Generator:
+    """Stream of the evictions of a randomized policy of the device's store (an index into simulator.STORES)"""
+    return stream(master_seed, replicate, STORE, dev_id, store)
@@ -1,7 +1,10 @@
-from collections import OrderedDict
-from typing import Optional, Hashable, Set
+from collections import deque
+from typing import AbstractSet, Callable, Dict, Optional, Hashable, Set, Deque, Tuple, FrozenSet
 
 from .clock import ClockView
+from .eviction import EvictionPolicy, LRUPolicy
+
+PolicyFactory = Callable[[], EvictionPolicy]
 
 
 class RequestStore:
@@ -12,93 +15,186 @@ class RequestStore:
             self.time = time
             self.devices = devices or set()
 
-    def __init__(self, clock: ClockView, timeout: int, max_capacity: Optional[int] = None):
+    _NO_REQUESTERS: FrozenSet[int] = frozenset()
+
+    def __init__(self, clock: ClockView, timeout: int, max_capacity: Optional[int] = None,
+                 policy: PolicyFactory = LRUPolicy):
         self._clock = clock
         self._timeout = timeout
         self.max_capacity: Optional[int] = max_capacity
-        self._d = OrderedDict()
+        # only bounded stores evict thus only they track the usage of their keys
+        self._policy: Optional[EvictionPolicy] = policy() if max_capacity is not None else None
+        self._d: Dict[Hashable, RequestStore.MPair] = {}
+        # (expiration, key) in order of expiration, expired records are evicted in bulk once per tick,
+        # thus all records in the store are valid and non-empty; items of records marked again are stale
+        self._expirations: Deque[Tuple[int, Hashable]] = deque()
+        self._evicted_at: Optional[int] = None
+        self._max_used_size = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0  # by the capacity, not by the timeout
+
+    def reset(self):
+        self._d.clear()
+        self._expirations.clear()
+        self._evicted_at = None
         self._max_used_size = 0
+        self.hits = self.misses = self.evictions = 0
+        if self._policy is not None:
+            self._policy.reset()
 
     def get_requesters(self, dsc: Hashable) -> Set[int]:
-        entry = self._d.get(dsc)
-        if entry is None or entry.time < self._clock.now:
-            self._clean_in_flight_requests(dsc)
+        entry = self._lookup(dsc)
+        if entry is None:
             return set()
-
-        self._d.move_to_end(dsc)
         return set(entry.devices)  # return copy since it is usually manipulated by other methods inside cycles
 
+    def pop_requesters_except(self, dsc: Hashable, exclude: int) -> AbstractSet[int]:
+        """
+        Removes all requesters of dsc but exclude and returns them, the returned set is no longer used by the store
+        Same as marking each of get_requesters(dsc) - {exclude} as not in flight.
+        """
+        entry = self._lookup(dsc)
+        if entry is None:
+            return RequestStore._NO_REQUESTERS
+
+        requesters = entry.devices
+        if exclude not in requesters:
+            self._remove(dsc)
+            return requesters
+
+        if len(requesters) == 1:
+            return RequestStore._NO_REQUESTERS
+
+        entry.devices = {exclude}
+        requesters.discard(exclude)
+        return requesters
+
     def is_request_in_flight_for_anybody(self, dsc: Hashable) -> bool:
-        return self._clean_in_flight_requests(dsc)
+        return self._lookup(dsc) is not None
 
     def mark_request_in_flight_for(self, dsc: Hashable, for_id: int, in_flight: bool = True):
+        self._evict_expired()
         if not in_flight:
             entry = self._d.get(dsc)
             if entry is None:
                 return
-            if for_id in entry.devices:
-                entry.devices.remove(for_id)
-            self._clean_in_flight_requests(dsc)
+            entry.devices.discard(for_id)
+            if len(entry.devices) == 0:
+                self._remove(dsc)
+            elif self._policy is not None:
+                self._policy.touch(dsc)
             return
 
-        # if it is an expired record remove it to clear expired device entries
-        self._clean_in_flight_requests(dsc)
-        if len(self._d) == self.max_capacity and dsc not in self._d:
-            self._d.popitem(last=False)
-        entry = self._d.setdefault(dsc, RequestStore.MPair())
-        self._d.move_to_end(dsc)
-        self._max_used_size = max(self._max_used_size, len(self._d))
+        entry = self._d.get(dsc)
+        if entry is None:
+            if len(self._d) == self.max_capacity:
+                self._remove(self._policy.victim())
+                self.evictions += 1
+            entry = self._d[dsc] = RequestStore.MPair()
+            if self._policy is not None:
+                self._policy.add(dsc)
+            self._max_used_size = max(self._max_used_size, len(self._d))
+        elif self._policy is not None:
+            self._policy.refresh(dsc)
 
         entry.time = self._clock.now + self._timeout
         entry.devices.add(for_id)
+        self._expirations.append((entry.time, dsc))
 
-    def _clean_in_flight_requests(self, dsc: Hashable) -> bool:
-        """Does the cleanup on the key and returns true if the record remains present thus is valid"""
+    def _evict_expired(self):
+        now = self._clock.now
+        if now == self._evicted_at:
+            return
+        self._evicted_at = now
+
+        expirations = self._expirations
+        while expirations and expirations[0][0] < now:
+            expiration, dsc = expirations.popleft()
+            entry = self._d.get(dsc)
+            if entry is not None and entry.time == expiration:
+                self._remove(dsc)
+
+    def _lookup(self, dsc: Hashable) -> Optional[MPair]:
+        self._evict_expired()
         entry = self._d.get(dsc)
         if entry is None:
-            return False
+            self.misses += 1
+            return None
 
-        if entry.time < self._clock.now or len(entry.devices) == 0:
-            del self._d[dsc]
-            return False
+        self.hits += 1
+        if self._policy is not None:
+            self._policy.touch(dsc)
+        return entry
 
-        self._d.move_to_end(dsc)
-        return True
+    def _remove(self, dsc: Hashable):
+        del self._d[dsc]
+        if self._policy is not None:
+            self._policy.remove(dsc)
 
 
 class RecentlySeenStore:
-    def __init__(self, clock: ClockView, timeout: int, max_capacity: Optional[int] = None):
+    def __init__(self, clock: ClockView, timeout: int, max_capacity: Optional[int] = None,
+                 policy: PolicyFactory = LRUPolicy):
         self._clock = clock
         self._timeout = timeout
         self.max_capacity: Optional[int] = max_capacity
-        self._d = OrderedDict()
+        self._policy: Optional[EvictionPolicy] = policy() if max_capacity is not None else None
+        self._d: Dict[Hashable, int] = {}
+        # (expiration, key) in order of expiration (the timeout is constant), an item is stale if the key
+        # has been marked again or evicted since, stale items are skipped once they reach the front
+        self._expirations: Deque[Tuple[int, Hashable]] = deque()
+        self._max_used_size = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0  # by the capacity, not by the timeout
+
+    def reset(self):
+        self._d.clear()
+        self._expirations.clear()
         self._max_used_size = 0
+        self.hits = self.misses = self.evictions = 0
+        if self._policy is not None:
+            self._policy.reset()
 
     def recently_seen(self, dsc: Hashable) -> bool:
-        seen = dsc in self._d and self._d[dsc] >= self._clock.now
-        if seen:
-            self._d.move_to_end(dsc)
+        expiration = self._d.get(dsc)
+        if expiration is not None and expiration >= self._clock.now:
+            self.hits += 1
+            if self._policy is not None:
+                self._policy.touch(dsc)
             return True
+        self.misses += 1
         return False
 
     def mark_recently_seen(self, dsc: Hashable):
+        expiration = self._clock.now + self._timeout
         if dsc in self._d:
-            self._d[dsc] = self._clock.now + self._timeout
-            self._d.move_to_end(dsc)
+            self._d[dsc] = expiration
+            if self._policy is not None:
+                self._policy.refresh(dsc)
+            self._expirations.append((expiration, dsc))
             return
 
         self._remove_obsolete()
         if len(self._d) == self.max_capacity:
-            self._d.popitem(last=False)
-
-        self._d[dsc] = self._clock.now + self._timeout
+            victim = self._policy.victim()
+            del self._d[victim]
+            self._policy.remove(victim)
+            self.evictions += 1
+
+        self._d[dsc] = expiration
+        if self._policy is not None:
+            self._policy.add(dsc)
+        self._expirations.append((expiration, dsc))
         self._max_used_size = max(self._max_used_size, len(self._d))
 
     def _remove_obsolete(self):
-        to_remove = []
-        for k, v in self._d.items():
-            if v < self._clock.now:
-                to_remove.append(k)
-
-        for k in to_remove:
-            del self._d[k]
+        now = self._clock.now
+        expirations = self._expirations
+        while expirations and expirations[0][0] < now:
+            expiration, k = expirations.popleft()
+            if self._d.get(k) == expiration:
+                del self._d[k]
+                if self._policy is not None:
+                    self._policy.remove(k)
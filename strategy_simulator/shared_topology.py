@@ -0,0 +1,178 @@
+from array import array
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Dict, List, Iterator, Optional, Sequence, Tuple
+
+from .firmware import Firmware
+
+_ITEM_SIZE = 8  # all arrays are int64 ('q') or float64 ('d')
+
+
+class SharedFirmwareData(Sequence):
+    """Read-only firmware payload living in shared memory, used as Firmware.data of running firmwares"""
+    __slots__ = ('_view', '_topology')
+
+    def __init__(self, view: memoryview, topology: 'SharedTopology'):
+        self._view = view
+        self._topology = topology  # keeps the shared memory mapped while the payload is in use
+
+    def __len__(self) -> int:
+        return len(self._view)
+
+    def __getitem__(self, i):
+        return self._view[i]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._view)
+
+    def __deepcopy__(self, memo):
+        return self  # immutable
+
+    def __reduce__(self):
+        # pickled (e.g. sent to another process) as a private copy, shared memory might not outlive the pickle
+        return list, (self._view.tolist(),)
+
+
+@dataclass(frozen=True)
+class SharedTopologyHandle:
+    """Picklable reference to a published SharedTopology, used to attach to it in other processes"""
+    name: str
+    num_devices: int
+    num_edges: int
+    num_firmwares: int
+    payload_size: int
+
+
+class SharedTopology:
+    """
+    Topology and firmware payloads of a SimulationBuilder published once in shared memory as compact arrays:
+    CSR adjacency (in the order of the graph's adjacency), per device writer reliability, device type and index
+    of the running firmware, firmware table (fw_type, version, offset, size) and concatenated payloads of the distinct firmwares.
+    Builders in other processes attach to it by its handle (SimulationBuilder.from_shared_topology)
+    and build devices without copying the topology or the firmwares.
+    """
+    def __init__(self, shm: shared_memory.SharedMemory, handle: SharedTopologyHandle, owner: bool):
+        self._shm = shm
+        self.handle: SharedTopologyHandle = handle
+        self._owner: bool = owner
+        self._closed: bool = False
+
+        n, e, m, p = handle.num_devices, handle.num_edges, handle.num_firmwares, handle.payload_size
+        views = []
+        start = 0
+        for size, fmt in [(n + 1, 'q'), (e, 'q'), (n, 'd'), (n, 'q'), (n, 'q'), (4 * m, 'q'), (p, 'q')]:
+            views.append(shm.buf[start:start + size * _ITEM_SIZE].cast(fmt))
+            start += size * _ITEM_SIZE
+        self.indptr, self.indices, self.reliability, self.dev_type, self.firmware_index, self._firmware_table, \
+            self._payload = views
+        self._firmwares: Optional[List[Firmware]] = None
+
+    @property
+    def num_devices(self) -> int:
+        return self.handle.num_devices
+
+    @property
+    def firmwares(self) -> List[Firmware]:
+        """Running firmwares indexed by firmware_index, their data are views into the shared memory"""
+        if self._firmwares is None:
+            self._firmwares = []
+            for i in range(self.handle.num_firmwares):
+                fw_type, version, offset, size = self._firmware_table[4 * i:4 * i + 4]
+                data = SharedFirmwareData(self._payload[offset:offset + size], self)
+                self._firmwares.append(Firmware(fw_type, version, data))
+        return self._firmwares
+
+    def neighbors(self, dev_id: int) -> Sequence[int]:
+        return self.indices[self.indptr[dev_id]:self.indptr[dev_id + 1]]
+
+    @classmethod
+    def publish(cls, builder) -> 'SharedTopology':
+        """Publishes topology and firmwares of the builder, the returned instance owns the shared memory block"""
+        graph = builder._graph
+        labels = list(graph.nodes)
+        int_mapping = {v: k for k, v in enumerate(labels)}
+
+        indptr = [0]
+        indices = []
+        for label in labels:
+            indices.extend(int_mapping[k] for k in graph.adj[label])
+            indptr.append(len(indices))
+
+        reliability = [graph.nodes[label].get('msg_success_rate', builder._default_link_reliability) for label in labels]
+
+        # default running firmware is the firmware 0, distinct firmwares of nodes follow, each stored once
+        firmwares = [builder._default_running_firmware]
+        by_version = {(firmwares[0].fw_type, firmwares[0].version): [0]}
+        firmware_index = []
+        dev_type = []
+        for label in labels:
+            fw = graph.nodes[label].get('running_firmware')
+            if fw is None:
+                firmware_index.append(0)
+                dev_type.append(builder._default_device_type)
+            else:
+                firmware_index.append(cls._firmware_index(fw, firmwares, by_version))
+                dev_type.append(fw.fw_type)
+
+        firmware_table = []
+        payload = []
+        for fw in firmwares:
+            if not fw.is_complete():
+                raise ValueError("Only complete firmwares can be published")
+            firmware_table.extend((fw.fw_type, fw.version, len(payload), fw.data_size))
+            payload.extend(fw.data)
+
+        handle_args = dict(num_devices=len(labels), num_edges=len(indices), num_firmwares=len(firmwares),
+                           payload_size=len(payload))
+        arrays = [indptr, indices, reliability, dev_type, firmware_index, firmware_table, payload]
+        size = max(sum(len(a) for a in arrays) * _ITEM_SIZE, 1)
+
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        topology = cls(shm, SharedTopologyHandle(name=shm.name, **handle_args), owner=True)
+        targets = [topology.indptr, topology.indices, topology.reliability, topology.dev_type,
+                   topology.firmware_index, topology._firmware_table, topology._payload]
+        for target, values in zip(targets, arrays):
+            target[:] = array(target.format, values)
+        return topology
+
+    @staticmethod
+    def _firmware_index(fw: Firmware, firmwares: List[Firmware], by_version: Dict[Tuple[int, int], List[int]]) -> int:
+        """Index of the firmware (the same object or one with equal payload) in firmwares, appended if not there"""
+        candidates = by_version.setdefault((fw.fw_type, fw.version), [])
+        for i in candidates:
+            if firmwares[i] is fw or firmwares[i].data == fw.data:
+                return i
+        candidates.append(len(firmwares))
+        firmwares.append(fw)
+        return len(firmwares) - 1
+
+    @classmethod
+    def attach(cls, handle: SharedTopologyHandle) -> 'SharedTopology':
+        return cls(shared_memory.SharedMemory(name=handle.name), handle, owner=False)
+
+    def close(self):
+        """
+        Detaches from the shared memory (and removes it if this instance has published it),
+        devices built from the topology must not be used afterwards
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for fw in self._firmwares or []:
+            fw.data._view.release()
+        for view in [self.indptr, self.indices, self.reliability, self.dev_type, self.firmware_index,
+                     self._firmware_table, self._payload]:
+            view.release()
+        self._firmwares = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self) -> 'SharedTopology':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
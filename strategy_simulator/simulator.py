@@ -1,16 +1,37 @@
+import functools
+import heapq
 import random
+import time
+import typing
 from copy import deepcopy
-from typing import List, Optional, Callable
+from dataclasses import dataclass
+from typing import List, Optional, Callable, Dict, Tuple, Iterable, Any, Set
 
 import networkx as nx
+import numpy as np
 
 from .device import Device, DeviceType
-from .firmware import Firmware, FW_TYPE_A
+from .firmware import Firmware, FirmwareImages, FW_TYPE_A
 from .iqueue import ReadQueue
-from .clock import Clock
+from .clock import Clock, ClockView
+from .convergence import ConvergenceTracker
+from .metrics import MessageCounters
+from .shared_topology import SharedTopology, SharedTopologyHandle
+from .rng import default_streams, link_stream, scheduler_stream, store_stream
+from .rs_store import PolicyFactory, RecentlySeenStore, RequestStore
+from .eviction import LRUPolicy
+
+if typing.TYPE_CHECKING:
+    from .checkpoint import Checkpointer
 
 Watcher = Callable[[List[Device]], None]
 
+# stores of a device which can be bounded by SimulationBuilder.with_store_limit, named as Device's arguments
+DIFF_ANNOUNCES_SEEN_STORE = 'diff_announces_seen_store'
+IN_FLIGHT_REQUESTS_STORE = 'in_flight_requests_store'
+DATAS_SEEN_STORE = 'datas_seen_store'
+STORES = (DIFF_ANNOUNCES_SEEN_STORE, IN_FLIGHT_REQUESTS_STORE, DATAS_SEEN_STORE)
+
 
 def watcher(blocking: bool = False, clean_screen: bool = False, print_long_device: bool = False, print_dev_progress: bool = True):
     def _watcher(devices: List[Device]):
@@ -29,7 +50,7 @@ def watcher(blocking: bool = False, clean_screen: bool = False, print_long_devic
                 if not d.upgrading:
                     print(f'{d.dev_id}: v{d.running_firmware.version}')
                 else:
-                    print(f'{d.dev_id}: {d._ongoing_upgrade.candidate_firmware.data_size - d._ongoing_upgrade.candidate_firmware.data.count(None)}')
+                    print(f'{d.dev_id}: {d._ongoing_upgrade.candidate_firmware.chunks_present}')
 
             print(64*'-')
             msgs_in_queues += d._input_queue._q.size()
@@ -41,32 +62,230 @@ def watcher(blocking: bool = False, clean_screen: bool = False, print_long_devic
     return _watcher
 
 
+# reasons of the end of a run
+STOP_CONDITION = 'stop_condition'
+MAX_TICKS = 'max_ticks'
+WALL_TIME = 'wall_time'
+STAGNATION = 'stagnation'
+
+
+@dataclass
+class RunResult:
+    """Outcome of a run, converged is False if a budget ended the run, reason tells which one"""
+    converged: bool
+    reason: str
+    ticks: int  # ticks simulated by the run
+    queued_messages: int
+    upgrading_devices: int
+
+
+class _Budget:
+    """
+    Limits of a single run: ticks simulated, wall time and ticks without any progress of upgrades
+    (see ConvergenceTracker.progress) which is the case of stuck runs, e.g. of unreachable devices.
+    A run stagnates only once no messages are queued and the timers pending at the last progress have fired,
+    i.e. every device has announced and every upgrading device has requested a chunk since then without any progress.
+    """
+    def __init__(self, sim: 'Simulator', max_ticks: Optional[int], wall_time: Optional[float],
+                 stagnation_ticks: Optional[int]):
+        self._sim = sim
+        self.start_at: int = sim.clock.now
+        self.max_ticks: Optional[int] = max_ticks
+        self.stagnation_ticks: Optional[int] = stagnation_ticks
+        self._deadline: Optional[float] = time.monotonic() + wall_time if wall_time is not None else None
+        self._progress: int = sim.convergence.progress
+        self._progress_at: int = self.start_at
+        self._timers_fire_at: int = self.start_at
+
+    def exceeded(self) -> Optional[str]:
+        now = self._sim.clock.now
+        progress = self._sim.convergence.progress
+        if progress != self._progress:
+            self._progress = progress
+            self._progress_at = now
+            self._timers_fire_at = now
+
+        if self.max_ticks is not None and now - self.start_at >= self.max_ticks:
+            return MAX_TICKS
+        if self.stagnation_ticks is not None and self._stagnant(now):
+            return STAGNATION
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            return WALL_TIME
+        return None
+
+    def horizon(self) -> Optional[int]:
+        """Time the clock must not jump over for the tick budgets to be checked exactly"""
+        limits = []
+        if self.max_ticks is not None:
+            limits.append(self.start_at + self.max_ticks)
+        if self.stagnation_ticks is not None:
+            limits.append(max(self._progress_at + self.stagnation_ticks, self._timers_fire_at))
+        return min(limits, default=None)
+
+    def _stagnant(self, now: int) -> bool:
+        if now - self._progress_at < self.stagnation_ticks or now < self._timers_fire_at:
+            return False
+        if self._sim.convergence.queued_messages > 0:
+            return False
+
+        # devices idle since the last progress will still announce or re-request when their timers fire
+        pending = []
+        for d in self._sim.devices:
+            if d._last_periodic_announce <= self._progress_at:
+                pending.append(d._last_periodic_announce + d.periodic_announce + 1)
+            if d.upgrading and d._ongoing_upgrade.last_progress <= self._progress_at:
+                pending.append(d._ongoing_upgrade.last_progress + d.progress_timeout + 1)
+        if pending:
+            self._timers_fire_at = min(pending)
+            return False
+        return True
+
+
 class Simulator:
-    def __init__(self, clock: Clock, devices: List[Device], shuffle: bool = False):
+    def __init__(self, clock: Clock, devices: List[Device], shuffle: bool = False,
+                 rng: Optional[np.random.Generator] = None):
         self._watcher: Optional[Callable] = None
+        self._checkpointer: Optional['Checkpointer'] = None
         self.devices = devices
         self.tick = 0
         self._clock = clock
         self.clock = self._clock.clock_view()
+        self._initial_time: int = clock.now
         self.shuffle: bool = shuffle
+        # order of devices is shuffled using the scheduler stream if given (see rng.scheduler_stream), else random
+        self._rng: Optional[np.random.Generator] = rng
+        self._rng_initial_state = rng.bit_generator.state if rng is not None else None
+        self.convergence: ConvergenceTracker = ConvergenceTracker()
+        self.convergence.track(self.devices)
+        self.counters: Optional[MessageCounters] = None
+
+    def enable_counters(self) -> MessageCounters:
+        """Counts messages sent, lost, overflowed and received by each device (see metrics.MessageCounters)"""
+        if self.counters is None:
+            self.counters = MessageCounters(len(self.devices))
+            self.counters.track(self.devices)
+        return self.counters
 
-    def run_for(self, ticks):
+    def disable_counters(self):
+        MessageCounters.untrack(self.devices)
+        self.counters = None
+
+    def run_for(self, ticks) -> RunResult:
         start_at: int = self._clock.now
-        self.run_until(lambda _: self._clock.now - start_at >= ticks)
+        return self.run_until(lambda _: self._clock.now - start_at >= ticks)
+
+    def run_until(self, stop_condition, max_ticks: Optional[int] = None, wall_time: Optional[float] = None,
+                  stagnation_ticks: Optional[int] = None) -> RunResult:
+        """
+        Runs until the stop condition holds or a budget is exhausted: max_ticks simulated, wall_time seconds elapsed
+        or stagnation_ticks ticks without any upgrade progress (no chunk received, no upgrade committed)
+        """
+        # devices might have been modified since the last run
+        self.convergence.track(self.devices)
+        budget = _Budget(self, max_ticks, wall_time, stagnation_ticks)
+        limited = max_ticks is not None or wall_time is not None or stagnation_ticks is not None
+
+        while True:
+            if stop_condition(self.devices):
+                reason = STOP_CONDITION
+                break
+            reason = budget.exceeded() if limited else None
+            if reason is not None:
+                break
 
-    def run_until(self, stop_condition):
-        while not stop_condition(self.devices):
             if self._watcher is not None:
                 self._watcher(self.devices)
 
-            devs = random.sample(self.devices, len(self.devices)) if self.shuffle else self.devices
+            devs = self._shuffled(self.devices) if self.shuffle else self.devices
             for device in devs:
                 device.tick()
             self._clock.tick()
 
+            if self._checkpointer is not None:
+                self._checkpointer.on_tick(self)
+
         if self._watcher is not None:
             self._watcher(self.devices)
 
+        return self._run_result(reason, budget)
+
+    def _run_result(self, reason: str, budget: _Budget) -> RunResult:
+        return RunResult(
+            converged=reason == STOP_CONDITION,
+            reason=reason,
+            ticks=self._clock.now - budget.start_at,
+            queued_messages=self.convergence.queued_messages,
+            upgrading_devices=sum(1 for d in self.devices if d.upgrading)
+        )
+
+    def reset(self, seed: Optional[int] = None):
+        """
+        Restores devices, their queues and stores, the clock and RNG streams to the state right after build,
+        thus the network can be rerun without being rebuilt. Reseeds the global RNG if seed is given.
+        """
+        self._clock.reset(self._initial_time)
+        self.tick = 0
+        if self._rng is not None:
+            self._rng.bit_generator.state = self._rng_initial_state
+        for d in self.devices:
+            d.reset()
+        self.convergence.track(self.devices)
+        if self.counters is not None:
+            self.counters.clear()
+
+        if seed is not None:
+            random.seed(seed)
+
+    def fork(self, n: int = 1) -> List['Simulator']:
+        """
+        Returns n independent copies of the simulation in its current state, each can be modified and run separately
+        Immutable parts (running firmwares, firmware images, messages) are shared among the copies,
+        the watcher is not copied.
+        """
+        shared = []
+        for d in self.devices:
+            shared.extend((d.running_firmware, d._initial_firmware))
+            if d._firmware_images is not None:
+                shared.append(d._firmware_images)
+                shared.extend(d._firmware_images.images())
+
+        return [deepcopy(self, {id(o): o for o in shared}) for _ in range(n)]
+
+    def device(self, dev_id: int) -> Device:
+        return next(d for d in self.devices if d.dev_id == dev_id)
+
+    def set_link_reliability(self, dev_id: int, reliability: float):
+        """Sets reliability of links from the device to its neighbors"""
+        for q in self.device(dev_id).neighbors.values():
+            q.write_reliability = reliability
+
+    def fail_link(self, dev_a: int, dev_b: int):
+        """Removes the link between the devices, messages already sent over the link are still delivered"""
+        self.device(dev_a).remove_neighbor(dev_b)
+        self.device(dev_b).remove_neighbor(dev_a)
+
+    def set_running_firmware(self, dev_id: int, firmware: Firmware):
+        """Replaces the running firmware of the device, e.g. to inject a new version into the network"""
+        self.device(dev_id).running_firmware = firmware
+
+    def _shuffled(self, items: list) -> list:
+        if self._rng is not None:
+            return [items[i] for i in self._rng.permutation(len(items))]
+        return random.sample(items, len(items))
+
+    def attach_checkpointer(self, checkpointer: 'Checkpointer'):
+        self._checkpointer = checkpointer
+
+    def detach_checkpointer(self):
+        self._checkpointer = None
+
+    def __getstate__(self):
+        # watcher and checkpointer are not part of the simulation state, thus are neither pickled nor copied
+        state = self.__dict__.copy()
+        state['_watcher'] = None
+        state['_checkpointer'] = None
+        return state
+
     def attach_watcher(self, watcher: Watcher):
         self._watcher = watcher
 
@@ -74,16 +293,148 @@ class Simulator:
         self._watcher = None
 
 
+class EventDrivenSimulator(Simulator):
+    """
+    Simulator which ticks only devices having something due (a message ready to be read or an expired timer)
+    and jumps the clock over the idle stretches in between.
+    Produces the same results as Simulator when shuffle is disabled, with shuffle enabled only the devices
+    due in a tick are shuffled.
+    The stop condition and the watcher are evaluated only after ticks in which some device was ticked,
+    time based stop conditions must therefore be bounded by until (see run_for).
+    """
+    def __init__(self, clock: Clock, devices: List[Device], shuffle: bool = False,
+                 rng: Optional[np.random.Generator] = None):
+        super().__init__(clock, devices, shuffle, rng)
+        self._index: Dict[int, int] = {d.dev_id: i for i, d in enumerate(devices)}
+        self._neighbors: List[List[int]] = [[self._index[n] for n in d.neighbors] for d in devices]
+        self._due: List[Optional[int]] = [None] * len(devices)
+        self._events: List[Tuple[int, int]] = []
+
+    def run_for(self, ticks) -> RunResult:
+        start_at: int = self._clock.now
+        return self.run_until(lambda _: self._clock.now - start_at >= ticks, until=start_at + ticks)
+
+    def run_until(self, stop_condition, until: Optional[int] = None, max_ticks: Optional[int] = None,
+                  wall_time: Optional[float] = None, stagnation_ticks: Optional[int] = None) -> RunResult:
+        # devices (their links) might have been modified since the last run, thus schedule everything from scratch
+        self.convergence.track(self.devices)
+        self._neighbors = [[self._index[n] for n in d.neighbors] for d in self.devices]
+        self._due = [None] * len(self.devices)
+        self._events = []
+        self._schedule(range(len(self.devices)))
+        budget = _Budget(self, max_ticks, wall_time, stagnation_ticks)
+        limited = max_ticks is not None or wall_time is not None or stagnation_ticks is not None
+
+        while True:
+            if stop_condition(self.devices):
+                reason = STOP_CONDITION
+                break
+            reason = budget.exceeded() if limited else None
+            if reason is not None:
+                break
+
+            next_time = self._next_event_time()
+            if until is not None:
+                next_time = min(next_time, until)
+            horizon = budget.horizon() if limited else None
+            if horizon is not None:
+                next_time = min(next_time, horizon)
+            if next_time > self._clock.now:
+                self._clock.jump_to(next_time)
+                continue
+
+            if self._watcher is not None:
+                self._watcher(self.devices)
+
+            due = self._pop_due()
+            if self.shuffle:
+                due = self._shuffled(due)
+            for i in due:
+                self.devices[i].tick()
+            self._clock.tick()
+
+            if self._checkpointer is not None:
+                self._checkpointer.on_tick(self)
+
+            affected = set(due)
+            for i in due:
+                affected.update(self._neighbors[i])
+            self._schedule(affected)
+
+        if self._watcher is not None:
+            self._watcher(self.devices)
+
+        return self._run_result(reason, budget)
+
+    def _schedule(self, indices: Iterable[int]):
+        now = self._clock.now
+        for i in indices:
+            t = max(self.devices[i].next_event_time(), now)
+            if self._due[i] != t:
+                self._due[i] = t
+                heapq.heappush(self._events, (t, i))
+
+    def _next_event_time(self) -> int:
+        while self._events:
+            t, i = self._events[0]
+            if self._due[i] == t:
+                return t
+            heapq.heappop(self._events)  # stale entry, the device has been rescheduled meanwhile
+
+        return self._clock.now
+
+    def _pop_due(self) -> List[int]:
+        now = self._clock.now
+        due = []
+        while self._events and self._events[0][0] <= now:
+            t, i = heapq.heappop(self._events)
+            if self._due[i] == t:
+                self._due[i] = None
+                due.append(i)
+
+        due.sort()
+        return due
+
+
 class SimulationBuilder:
     def __init__(self):
         self._graph: Optional[nx.Graph] = None
         self._debug: bool = False
         self._queues_max_len = None
+        self._event_driven: bool = False
+        self._shared_topology: Optional[SharedTopology] = None
+        self._rng_streams: Optional[Tuple[int, int]] = None
+        self._periodic_announce: int = 100
+        self._progress_timeout: int = 100
+        self._store_limits: Dict[str, Tuple[int, PolicyFactory]] = {}
+        self._counters: bool = False
 
     def from_networkx_graph(self, graph) -> 'SimulationBuilder':
         self._graph = graph
         return self
 
+    def from_shared_topology(self, handle: SharedTopologyHandle) -> 'SimulationBuilder':
+        """
+        Attaches to a topology published by SharedTopology.publish, devices are then built from its arrays
+        and share its running firmwares instead of copying them. Defaults of the publishing builder apply.
+        The builder stays attached until it is closed (see close), e.g. by using it as a context manager.
+        """
+        self.close()
+        self._shared_topology = SharedTopology.attach(handle)
+        return self
+
+    def close(self):
+        """Detaches from the shared topology if attached, simulations built from it must not be used afterwards"""
+        if self._shared_topology is not None:
+            self._shared_topology.close()
+            self._shared_topology = None
+
+    def __enter__(self) -> 'SimulationBuilder':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
     def with_default_running_firmware(self, firmware: Firmware) -> 'SimulationBuilder':
         self._default_running_firmware = firmware
         return self
@@ -104,7 +455,50 @@ class SimulationBuilder:
         self._queues_max_len = maxlen
         return self
 
+    def with_event_driven_scheduler(self, event_driven: bool = True) -> 'SimulationBuilder':
+        self._event_driven = event_driven
+        return self
+
+    def with_periodic_announce(self, periodic_announce: int) -> 'SimulationBuilder':
+        self._periodic_announce = periodic_announce
+        return self
+
+    def with_progress_timeout(self, progress_timeout: int) -> 'SimulationBuilder':
+        self._progress_timeout = progress_timeout
+        return self
+
+    def with_store_limit(self, store: str, max_capacity: int, policy: PolicyFactory = LRUPolicy) -> 'SimulationBuilder':
+        """
+        Bounds the store of each device, store is one of STORES, policy (see eviction.py) chooses the record
+        evicted when the store is full. Stores are unbounded by default.
+        """
+        if store not in STORES:
+            raise ValueError(f"Unknown store {store}, expected one of {STORES}")
+        if max_capacity < 1:
+            raise ValueError(f"Store capacity must be at least 1, got {max_capacity}")
+        self._store_limits[store] = (max_capacity, policy)
+        return self
+
+    def with_counters(self, enabled: bool = True) -> 'SimulationBuilder':
+        """Built simulations count messages per device, type and event (see Simulator.enable_counters)"""
+        self._counters = enabled
+        return self
+
+    def with_rng_streams(self, master_seed: Optional[int] = None, replicate: int = 0) -> 'SimulationBuilder':
+        """
+        Each link and the scheduler draw from their own streams derived from the master seed and the replicate
+        (the ones set by rng.seed_streams if no master seed is given) instead of the global random, thus runs
+        are reproducible regardless of the order of devices, partitioning or the process they run in
+        """
+        if master_seed is None:
+            master_seed, replicate = default_streams()
+        self._rng_streams = (master_seed, replicate)
+        return self
+
     def build(self) -> Simulator:
+        if self._shared_topology is not None:
+            return self._build_from_shared_topology()
+
         clock = Clock()
         cv = clock.clock_view()
         int_mapping = {v: k for k, v in enumerate(list(self._graph.nodes))}
@@ -112,29 +506,123 @@ class SimulationBuilder:
         queues = {label: ReadQueue(cv, self._debug, maxlen=self._queues_max_len) for label in self._graph.nodes}
         colors = []
         d_fw = Firmware(self._default_device_type, 0, [])
-        devices = [
+        devices = self._build_devices(cv, queues, queues)
+
+        relabeled = nx.relabel_nodes(self._graph, int_mapping, copy=True)
+        for n in relabeled:
+            if relabeled.nodes[n].get('running_firmware', d_fw).fw_type == FW_TYPE_A:
+                colors.append('#FF0000')
+            else:
+                colors.append('#00FF00')
+
+        return self._simulator(clock, devices)
+
+    def _simulator(self, clock: Clock, devices: List[Device]) -> Simulator:
+        rng = scheduler_stream(*self._rng_streams) if self._rng_streams is not None else None
+        if self._event_driven:
+            s = EventDrivenSimulator(clock, devices, rng=rng)
+        else:
+            s = Simulator(clock, devices, rng=rng)
+        if self._counters:
+            s.enable_counters()
+        return s
+
+    def _link_rng(self, writer_id: int, reader_id: int) -> Optional[np.random.Generator]:
+        if self._rng_streams is None:
+            return None
+        master_seed, replicate = self._rng_streams
+        return link_stream(master_seed, replicate, writer_id, reader_id)
+
+    def _store_policy(self, policy: PolicyFactory, dev_id: int, store: str) -> PolicyFactory:
+        if not getattr(policy, 'randomized', False) or self._rng_streams is None:
+            return policy
+        master_seed, replicate = self._rng_streams
+        return functools.partial(policy, rng=store_stream(master_seed, replicate, dev_id, STORES.index(store)))
+
+    def _stores(self, clock: ClockView, dev_id: int) -> Dict[str, Any]:
+        """
+        Bounded stores of a device as keyword arguments of Device, the timeouts are the same as Device's ones,
+        randomized policies draw from the store's stream if the simulation uses RNG streams
+        """
+        timeouts = {
+            DIFF_ANNOUNCES_SEEN_STORE: self._periodic_announce // 2,
+            IN_FLIGHT_REQUESTS_STORE: self._progress_timeout // 2,
+            DATAS_SEEN_STORE: self._progress_timeout // 2,
+        }
+        return {
+            store: (RequestStore if store == IN_FLIGHT_REQUESTS_STORE else RecentlySeenStore)(
+                clock, timeout=timeouts[store], max_capacity=max_capacity,
+                policy=self._store_policy(policy, dev_id, store))
+            for store, (max_capacity, policy) in self._store_limits.items()
+        }
+
+    def _build_devices(self, clock: ClockView, input_queues: Dict[Any, ReadQueue], neighbor_queues: Dict[Any, Any],
+                       node_labels: Optional[Set[Any]] = None) -> List[Device]:
+        """
+        Creates devices reading input_queues and writing into write queues created by neighbor_queues
+        (both indexed by node label), only devices of node_labels are created if given
+        """
+        int_mapping = {v: k for k, v in enumerate(list(self._graph.nodes))}
+        d_fw = Firmware(self._default_device_type, 0, [])
+
+        images = FirmwareImages()
+        images.register(self._default_running_firmware)
+        for node_label in self._graph.nodes:
+            if 'running_firmware' in self._graph.nodes[node_label]:
+                images.register(self._graph.nodes[node_label]['running_firmware'])
+
+        return [
             Device(
                 dev_id=i,
                 dev_type=self._graph.nodes[node_label].get('running_firmware', d_fw).fw_type,
-                input_queue=queues[node_label],
+                input_queue=input_queues[node_label],
                 neighbors={
-                    int_mapping[k]: queues[k].write_queue_for_writer(
+                    int_mapping[k]: neighbor_queues[k].write_queue_for_writer(
                         writer_id=i,
-                        write_reliability=self._graph.nodes[node_label].get('msg_success_rate', self._default_link_reliability)
+                        write_reliability=self._graph.nodes[node_label].get('msg_success_rate', self._default_link_reliability),
+                        rng=self._link_rng(i, int_mapping[k])
                     )
                     for k in self._graph.adj[node_label]
                 },
-                running_firmware=self._graph.nodes[node_label].get('running_firmware', deepcopy(self._default_running_firmware)),
-                clock=cv
+                # running firmwares are never modified thus the default one is shared by the devices
+                running_firmware=self._graph.nodes[node_label].get('running_firmware', self._default_running_firmware),
+                clock=clock,
+                periodic_announce=self._periodic_announce,
+                progress_timeout=self._progress_timeout,
+                firmware_images=images,
+                **self._stores(clock, i)
             )
             for i, node_label in enumerate(self._graph.nodes)
+            if node_labels is None or node_label in node_labels
         ]
 
-        relabeled = nx.relabel_nodes(self._graph, int_mapping, copy=True)
-        for n in relabeled:
-            if relabeled.nodes[n].get('running_firmware', d_fw).fw_type == FW_TYPE_A:
-                colors.append('#FF0000')
-            else:
-                colors.append('#00FF00')
+    def _build_from_shared_topology(self) -> Simulator:
+        clock = Clock()
+        cv = clock.clock_view()
+        t = self._shared_topology
+        images = FirmwareImages()
+        for fw in t.firmwares:
+            images.register(fw)
+
+        queues = [ReadQueue(cv, self._debug, maxlen=self._queues_max_len) for _ in range(t.num_devices)]
+        devices = [
+            Device(
+                dev_id=i,
+                dev_type=t.dev_type[i],
+                input_queue=queues[i],
+                neighbors={
+                    j: queues[j].write_queue_for_writer(writer_id=i, write_reliability=t.reliability[i],
+                                                        rng=self._link_rng(i, j))
+                    for j in t.neighbors(i)
+                },
+                running_firmware=t.firmwares[t.firmware_index[i]],  # running firmwares are never modified
+                clock=cv,
+                periodic_announce=self._periodic_announce,
+                progress_timeout=self._progress_timeout,
+                firmware_images=images,
+                **self._stores(cv, i)
+            )
+            for i in range(t.num_devices)
+        ]
 
-        return Simulator(clock, devices)
+        return self._simulator(clock, devices)
@@ -1,19 +1,32 @@
+import functools
 import itertools
+import os
 import random
-from dataclasses import dataclass, field
-from typing import Any, List, Iterable, Dict, Tuple
+import tempfile
+from dataclasses import dataclass, field, replace
+from typing import Any, List, Iterable, Iterator, Dict, Tuple, Optional
 
 import networkx as nx
+import numpy as np
 
+from .checkpoint import load_checkpoint, save_checkpoint
 from .custom_nets import spaceship, radial, neighbors_iterated_hull
 from .firmware import Firmware, FW_TYPE_A, FW_TYPE_B
-from .messages import AnnounceMessage, RequestMessage, DataMessage
-from .simulator import Simulator, SimulationBuilder, watcher
-from .utils import general_stopping_condition
+from .messages import AnnounceMessage, RequestMessage, DataMessage, MESSAGE_TYPES
+from .metrics import LOST, OVERFLOWED, RECEIVED, SENT
+from .shared_topology import SharedTopologyHandle
+from .rng import seed_streams
+from .rs_store import PolicyFactory
+from .simulator import Simulator, SimulationBuilder, watcher, DIFF_ANNOUNCES_SEEN_STORE, IN_FLIGHT_REQUESTS_STORE, \
+    DATAS_SEEN_STORE, STORES
+from .partitioned import PartitionedSimulator
+from .utils import general_stopping_condition, tracked_stopping_condition
+from .vectorized import MESSAGE_TYPE_NAMES, VectorizedSimulator
 
 
 def setup_rng():
     random.seed(123456789)
+    seed_streams(123456789)
 
 
 def soft_assert(actual, expected, msg):
@@ -31,8 +44,197 @@ def repeated(simulation_factory, repetitions: int):
     return [simulation_factory() for _ in range(repetitions)]
 
 
-def grid_single_type(grid_size_x: int = 10, grid_size_y: int = 10, fw_size: int = 10, link_reliability: float = 1.0,
-                     log_messages: bool = False, seed_node: Tuple[int, int] = (0, 0)) -> Simulator:
+def ensemble_avg_runtime(builder_factory, count: int, dev_type: Optional[int] = None, shuffle: bool = True):
+    """Same as avg_runtime but all the replicates are simulated at once by VectorizedSimulator"""
+    v = VectorizedSimulator.from_builder(builder_factory(), shuffle=shuffle, replicates=count)
+    v.run_until_converged(dev_type=dev_type)
+    return float(v.runtimes.mean())
+
+
+def shared_topology(handle: SharedTopologyHandle, dev_type: Optional[int] = None, log_messages: bool = False) -> Simulator:
+    """
+    Runs the topology published by SharedTopology.publish, usable as replicates.Scenario factory
+    The returned simulator is detached from the topology, i.e. it can be inspected (by extract_stats) but not run
+    """
+    with SimulationBuilder().from_shared_topology(handle) as sb:
+        sb.with_debug(log_messages)
+        s = sb.build()
+        s.shuffle = True
+        s.run_until(tracked_stopping_condition(s, dev_type=dev_type))
+
+    return s
+
+
+def rerun(simulator: Simulator, repetitions: int, dev_type: Optional[int] = None) -> Iterator[Simulator]:
+    """
+    Counterpart of repeated which runs the same simulator until convergence, resetting it in between of the runs
+    Each yielded simulator is valid only until the next iteration
+    """
+    for _ in range(repetitions):
+        simulator.reset()
+        simulator.run_until(tracked_stopping_condition(simulator, dev_type=dev_type))
+        yield simulator
+
+
+def rerun_avg_runtime(builder_factory, count: int, dev_type: Optional[int] = None, shuffle: bool = True):
+    """Same as avg_runtime but the network is built only once"""
+    s = builder_factory().build()
+    s.shuffle = shuffle
+    vals = [x.clock.now for x in rerun(s, count, dev_type)]
+    return sum(vals) / count
+
+
+def reset_matches_first_run(builder_factory, dev_type: Optional[int] = None) -> bool:
+    """
+    Runs the network of builder_factory() (shuffled) until convergence, resets it and runs it again, both runs
+    must be identical thus losses, shuffle orders and evictions must come from RNG streams
+    """
+    s = builder_factory().build()
+    s.shuffle = True
+    s.run_until(tracked_stopping_condition(s, dev_type=dev_type))
+    first = extract_stats(s)
+    return extract_stats(next(rerun(s, 1, dev_type))) == first
+
+
+def run_summary(s: Simulator) -> Tuple[int, int, List[int], List[int]]:
+    """Runtime, messages left in queues, running versions and input queues' max used sizes, equal for equal runs"""
+    return s.clock.now, s.convergence.queued_messages, [d.running_firmware.version for d in s.devices], \
+        [d._input_queue._q._max_used for d in s.devices]
+
+
+def event_driven_matches_tick_loop(builder_factory, dev_type: Optional[int] = None,
+                                   resume_after: Optional[int] = None) -> bool:
+    """
+    Runs the network of builder_factory() by the tick loop and by the event-driven scheduler (both unshuffled)
+    until convergence, first for resume_after ticks and then resumed if given. Losses must come from RNG streams.
+    """
+    summaries = []
+    for event_driven in (False, True):
+        s = builder_factory().with_event_driven_scheduler(event_driven).build()
+        if resume_after is not None:
+            s.run_for(resume_after)
+        s.run_until(tracked_stopping_condition(s, dev_type=dev_type))
+        summaries.append(run_summary(s))
+    return summaries[0] == summaries[1]
+
+
+def partitioned_matches_single_process(builder_factory, parts: int, dev_type: Optional[int] = None) -> bool:
+    """
+    Runs the network of builder_factory() until convergence in one process and by PartitionedSimulator split
+    into parts, the runs must be identical (see PartitionedSimulator), message logs included if debug is on,
+    but for input queues' max used sizes which are approximate in partitioned runs
+    """
+    s = builder_factory().build()
+    s.run_until(tracked_stopping_condition(s, dev_type=dev_type))
+    with PartitionedSimulator(builder_factory(), parts) as p:
+        p.run_until(functools.partial(general_stopping_condition, dev_type=dev_type))
+        return replace(extract_stats(p.collect()), input_queue_max=[]) == replace(extract_stats(s), input_queue_max=[])
+
+
+def resumed_matches_uninterrupted(builder_factory, interrupt_at: int, dev_type: Optional[int] = None) -> bool:
+    """
+    Runs the network of builder_factory() (shuffled) until convergence uninterrupted and again interrupted
+    at interrupt_at, continued by a fork and by the simulation loaded from a checkpoint taken at that time.
+    All three runs must be identical, losses and shuffle orders must come from RNG streams.
+    """
+    def converged(sim: Simulator) -> Simulator:
+        sim.run_until(tracked_stopping_condition(sim, dev_type=dev_type))
+        return sim
+
+    def build() -> Simulator:
+        sim = builder_factory().build()
+        sim.shuffle = True
+        return sim
+
+    expected = extract_stats(converged(build()))
+
+    s = build()
+    s.run_for(interrupt_at)
+    forked = s.fork()[0]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'checkpoint')
+        save_checkpoint(s, path)
+        loaded = load_checkpoint(path)
+
+    return extract_stats(converged(forked)) == expected and extract_stats(converged(loaded)) == expected
+
+
+def vectorized_matches_device_model(builder_factory, dev_type: Optional[int] = None) -> bool:
+    """
+    Runs the network of builder_factory() until convergence by Simulator and by VectorizedSimulator (both unshuffled),
+    runtimes and message counts must be identical as long as no random decision influences the runs (all links
+    are reliable). Queues' max used sizes differ as Simulator interleaves reads and writes of devices within a tick.
+    """
+    s = builder_factory().with_counters().build()
+    s.run_until(tracked_stopping_condition(s, dev_type=dev_type))
+    expected = extract_stats(s)
+
+    v = VectorizedSimulator.from_builder(builder_factory())
+    v.run_until_converged(dev_type=dev_type)
+    actual = v.extract_stats()
+
+    return actual.runtime == expected.runtime and all(
+        actual.sent_by_type[t] == expected.sent_by_type_len(t) and
+        actual.received_by_type[t] == expected.received_by_type_len(t) and
+        actual.overflowed_by_type[t] == expected.overflowed_by_type_len(t)
+        for t in MESSAGE_TYPE_NAMES
+    )
+
+
+def bounded_stores_hold(builder_factory, max_capacity: int, policy: PolicyFactory,
+                        dev_type: Optional[int] = None) -> bool:
+    """
+    Runs the network of builder_factory() with all stores of devices bounded to max_capacity under the policy
+    until convergence, twice with a differently seeded global random. The stores must never outgrow the capacity
+    and must have evicted, both runs must be identical thus losses must come from RNG streams.
+    """
+    stats = []
+    for seed in (0, 1):
+        random.seed(seed)
+        b = builder_factory()
+        for store in STORES:
+            b.with_store_limit(store, max_capacity, policy)
+        s = b.build()
+        if not s.run_until(tracked_stopping_condition(s, dev_type=dev_type), max_ticks=100000).converged:
+            return False
+        stores = [getattr(d, f'_{store}') for d in s.devices for store in STORES]
+        if any(st._max_used_size > max_capacity for st in stores) or not any(st.evictions for st in stores):
+            return False
+        stats.append(extract_stats(s))
+    return stats[0] == stats[1]
+
+
+def message_counters_conserved(builder_factory, ticks: int) -> bool:
+    """
+    Runs the network of builder_factory() with counters for ticks, each message sent (i.e. not lost) must have been
+    received, overflowed or still be queued, both per message type and in total. Queues must have overflowed.
+    Messages logged by the queues (if debug is on) must agree with the counters.
+    """
+    s = builder_factory().with_counters().build()
+    s.run_for(ticks)
+
+    queued = [0] * len(MESSAGE_TYPES)
+    for d in s.devices:
+        for _, m in itertools.chain(d._input_queue._q._ready, d._input_queue._q._pushed):
+            queued[m.KIND] += 1
+
+    c = s.counters.to_numpy().sum(axis=0)
+    if s.devices[0]._input_queue.debug:
+        stats = extract_stats(s)
+        logged = (stats.sent_messages_by_type, stats.lost_messages_by_type, stats.overflowed_messages_by_type,
+                  stats.received_messages_by_type)
+        for t in MESSAGE_TYPES:
+            counted = c[t.KIND, [SENT, LOST, OVERFLOWED, RECEIVED]].tolist()
+            if [len(messages.get(t.__name__, [])) for messages in logged] != counted:
+                return False
+
+    return sum(queued) == s.convergence.queued_messages and c[:, OVERFLOWED].sum() > 0 and \
+        all(c[kind, SENT] == c[kind, RECEIVED] + c[kind, OVERFLOWED] + queued[kind] for kind in range(len(queued)))
+
+
+def grid_single_type_builder(grid_size_x: int = 10, grid_size_y: int = 10, fw_size: int = 10,
+                             link_reliability: float = 1.0, log_messages: bool = False,
+                             seed_node: Tuple[int, int] = (0, 0)) -> SimulationBuilder:
     graph: nx.Graph = nx.grid_2d_graph(grid_size_x, grid_size_y)
 
     graph.nodes[seed_node]["running_firmware"] = Firmware(FW_TYPE_A, 2, [2 * i for i in range(fw_size)])
@@ -43,10 +245,15 @@ def grid_single_type(grid_size_x: int = 10, grid_size_y: int = 10, fw_size: int
     sb.with_default_link_reliability(link_reliability)
     sb.with_debug(log_messages)
     sb.from_networkx_graph(graph)
+    return sb
+
+
+def grid_single_type(grid_size_x: int = 10, grid_size_y: int = 10, fw_size: int = 10, link_reliability: float = 1.0,
+                     log_messages: bool = False, seed_node: Tuple[int, int] = (0, 0)) -> Simulator:
+    sb = grid_single_type_builder(grid_size_x, grid_size_y, fw_size, link_reliability, log_messages, seed_node)
     s = sb.build()
     s.shuffle = True
-    s.run_until(lambda x:
-                general_stopping_condition(x, dev_type=None))
+    s.run_until(tracked_stopping_condition(s, dev_type=None))
 
     return s
 
@@ -65,8 +272,7 @@ def grid_single_type_center(grid_size_x: int = 10, grid_size_y: int = 10, fw_siz
     sb.from_networkx_graph(graph)
     s = sb.build()
     s.shuffle = True
-    s.run_until(lambda x:
-                general_stopping_condition(x, dev_type=None))
+    s.run_until(tracked_stopping_condition(s, dev_type=None))
 
     return s
 
@@ -93,8 +299,7 @@ def grid_single_type_center_radial(radius, fw_size: int = 10, link_reliability:
     sb.from_networkx_graph(graph)
     s = sb.build()
     s.shuffle = True
-    s.run_until(lambda x:
-                general_stopping_condition(x, dev_type=None))
+    s.run_until(tracked_stopping_condition(s, dev_type=None))
 
     return s
 
@@ -125,8 +330,7 @@ def grid_multi_type_center_radial(radius, fw_size: int = 10, link_reliability: f
     sb.from_networkx_graph(graph)
     s = sb.build()
     s.shuffle = True
-    s.run_until(lambda x:
-                general_stopping_condition(x, dev_type=FW_TYPE_B))
+    s.run_until(tracked_stopping_condition(s, dev_type=FW_TYPE_B))
 
     return s
 
@@ -160,8 +364,7 @@ def grid_multi_type_center_radial_single_component(radius, fw_size: int = 10, li
     sb.from_networkx_graph(graph)
     s = sb.build()
     s.shuffle = True
-    s.run_until(lambda x:
-                general_stopping_condition(x, dev_type=FW_TYPE_B))
+    s.run_until(tracked_stopping_condition(s, dev_type=FW_TYPE_B))
 
     return s
 
@@ -185,8 +388,7 @@ def grid_multi_type(grid_size_x: int = 10, grid_size_y: int = 10, fw_size: int =
 
     if watch:
         s.attach_watcher(watcher(blocking=True))
-    s.run_until(lambda x:
-                general_stopping_condition(x, dev_type=FW_TYPE_B))
+    s.run_until(tracked_stopping_condition(s, dev_type=FW_TYPE_B))
 
     return s
 
@@ -205,14 +407,13 @@ def barbell_single_type(bell_size: int = 10, path_length: int = 10, fw_size: int
     sb.from_networkx_graph(graph)
     s = sb.build()
     s.shuffle = True
-    s.run_until(lambda x:
-                general_stopping_condition(x, dev_type=None))
+    s.run_until(tracked_stopping_condition(s, dev_type=None))
 
     return s
 
 
-def barbell_multi_type(bell_size: int = 10, path_length: int = 10, fw_size: int = 10, link_reliability: float = 1.0,
-                     log_messages: bool = False) -> Simulator:
+def barbell_multi_type_builder(bell_size: int = 10, path_length: int = 10, fw_size: int = 10,
+                               link_reliability: float = 1.0, log_messages: bool = False) -> SimulationBuilder:
     graph: nx.Graph = nx.barbell_graph(bell_size, path_length)
 
     graph.nodes[0]["running_firmware"] = Firmware(FW_TYPE_B, 2, [2 * i for i in range(fw_size)])
@@ -224,9 +425,14 @@ def barbell_multi_type(bell_size: int = 10, path_length: int = 10, fw_size: int
     sb.with_default_link_reliability(link_reliability)
     sb.with_debug(log_messages)
     sb.from_networkx_graph(graph)
+    return sb
+
+
+def barbell_multi_type(bell_size: int = 10, path_length: int = 10, fw_size: int = 10, link_reliability: float = 1.0,
+                     log_messages: bool = False) -> Simulator:
+    sb = barbell_multi_type_builder(bell_size, path_length, fw_size, link_reliability, log_messages)
     s = sb.build()
-    s.run_until(lambda x:
-                general_stopping_condition(x, dev_type=FW_TYPE_B))
+    s.run_until(tracked_stopping_condition(s, dev_type=FW_TYPE_B))
 
     return s
 
@@ -247,8 +453,7 @@ def spaceship_multi_type(fw_size: int = 10, link_reliability: float = 1.0,
     s = sb.build()
     if watch:
         s.attach_watcher(watcher(blocking=True, ))
-    s.run_until(lambda x:
-                general_stopping_condition(x, dev_type=FW_TYPE_B))
+    s.run_until(tracked_stopping_condition(s, dev_type=FW_TYPE_B))
 
     return s
 
@@ -267,8 +472,7 @@ def path_ended_multi_type(length: int = 5, fw_size: int = 10, link_reliability:
     sb.with_debug(log_messages)
     sb.from_networkx_graph(graph)
     s = sb.build()
-    s.run_until(lambda x:
-                general_stopping_condition(x, dev_type=FW_TYPE_B))
+    s.run_until(tracked_stopping_condition(s, dev_type=FW_TYPE_B))
 
     return s
 
@@ -294,24 +498,42 @@ class Stats:
     datas_seen_store_max: List[int] = field(default_factory=lambda: list())
     in_flight_reqs_max: List[int] = field(default_factory=lambda: list())
     input_queue_max: List[int] = field(default_factory=lambda: list())
+    # per device hits, misses and evictions (by the capacity) of each store, indexed by [store][device]
+    store_hits: Dict[str, List[int]] = field(default_factory=lambda: dict())
+    store_misses: Dict[str, List[int]] = field(default_factory=lambda: dict())
+    store_evictions: Dict[str, List[int]] = field(default_factory=lambda: dict())
+    # counters of the simulation if enabled (see Simulator.enable_counters), indexed by [device, message kind, event]
+    message_counts: Optional[np.ndarray] = field(default=None, compare=False)  # arrays have no truth value
     # simulator: Optional[Simulator] = None
 
     def received_by_type_len(self, typee: Any):
+        if self.message_counts is not None:
+            return self._count(typee, RECEIVED)
         typee = typee if isinstance(typee, str) else typee.__name__
         return len(self.received_messages_by_type.get(typee, []))
 
     def sent_by_type_len(self, typee: Any):
+        if self.message_counts is not None:
+            return self._count(typee, SENT)
         typee = typee if isinstance(typee, str) else typee.__name__
         return len(self.sent_messages_by_type.get(typee, []))
 
     def lost_by_type_len(self, typee: Any):
+        if self.message_counts is not None:
+            return self._count(typee, LOST)
         typee = typee if isinstance(typee, str) else typee.__name__
         return len(self.lost_messages_by_type.get(typee, []))
 
     def overflowed_by_type_len(self, typee: Any):
+        if self.message_counts is not None:
+            return self._count(typee, OVERFLOWED)
         typee = typee if isinstance(typee, str) else typee.__name__
         return len(self.overflowed_messages_by_type.get(typee, []))
 
+    def _count(self, typee: Any, event: int) -> int:
+        kind = next(t.KIND for t in MESSAGE_TYPES if typee in (t, t.__name__))
+        return int(self.message_counts[:, kind, event].sum())
+
     def __str__(self):
         return f"R: " \
                f"A: {self.received_by_type_len(AnnounceMessage)}, " \
@@ -347,7 +569,7 @@ def extract_stats(s: Simulator) -> Stats:
 
     lost_by_type = group_by_type(itertools.chain().from_iterable(lost_messages))
     sent_by_type = group_by_type(itertools.chain().from_iterable(sent_messages))
-    overflowed_by_type = group_by_type(itertools.chain().from_iterable(overflowed_messages))
+    overflowed_by_type = group_by_type(i[1] for i in itertools.chain().from_iterable(overflowed_messages))
     received_messages = group_by_type(i[1] for i in itertools.chain().from_iterable(received_messages))
 
     input_queue_max = [d._input_queue._q._max_used for d in devs]
@@ -355,6 +577,12 @@ def extract_stats(s: Simulator) -> Stats:
     datas_seen_store_max = [d._datas_seen_store._max_used_size for d in devs]
     in_flight_reqs_max = [d._in_flight_requests_store._max_used_size for d in devs]
 
+    stores = {
+        DIFF_ANNOUNCES_SEEN_STORE: [d._diff_announces_seen_store for d in devs],
+        IN_FLIGHT_REQUESTS_STORE: [d._in_flight_requests_store for d in devs],
+        DATAS_SEEN_STORE: [d._datas_seen_store for d in devs],
+    }
+
     return Stats(
         runtime=runtime,
         num_devices=len(s.devices),
@@ -365,5 +593,9 @@ def extract_stats(s: Simulator) -> Stats:
         announce_seen_store_max=announce_seen_store_max,
         datas_seen_store_max=datas_seen_store_max,
         in_flight_reqs_max=in_flight_reqs_max,
-        input_queue_max=input_queue_max
+        input_queue_max=input_queue_max,
+        store_hits={k: [x.hits for x in v] for k, v in stores.items()},
+        store_misses={k: [x.misses for x in v] for k, v in stores.items()},
+        store_evictions={k: [x.evictions for x in v] for k, v in stores.items()},
+        message_counts=s.counters.to_numpy().copy() if s.counters is not None else None
     )
@@ -1,8 +1,12 @@
+import typing
 from copy import deepcopy
 from typing import Optional, Callable, List
 
 from .device import Device
 
+if typing.TYPE_CHECKING:
+    from .simulator import Simulator
+
 
 def device_has_fw_ver(version: int, dev_type: Optional[int] = None) -> Callable[[Device], bool]:
     def _device_has_fw_ver(device: Device) -> bool:
@@ -39,7 +43,16 @@ def general_stopping_condition(devs: List[Device], dev_type=None) -> bool:
     return fw_ver# and no_messages
 
 
+def tracked_stopping_condition(sim: 'Simulator', dev_type=None) -> Callable[[List[Device]], bool]:
+    """Same as general_stopping_condition but answered in O(1) by the simulator's convergence tracker"""
+    def _tracked_stopping_condition(_devs: List[Device]) -> bool:
+        return sim.convergence.all_have_fw_ver(2, dev_type)
+
+    return _tracked_stopping_condition
+
+
 def sum_queues_lengths(devs: List[Device], dev_type=None) -> int:
+    """O(N), the total over all devices is kept by the simulator's tracker (ConvergenceTracker.queued_messages)"""
     if dev_type is not None:
         return sum(d._input_queue._q.size() for d in devs if d.dev_type == dev_type)
 
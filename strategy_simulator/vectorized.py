@@ -0,0 +1,515 @@
+import random
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import stats
+
+from .clock import Clock
+from .firmware import Firmware
+from .messages import ANNOUNCE, REQUEST, DATA, MESSAGE_TYPES
+from .utils import tracked_stopping_condition
+
+MESSAGE_TYPE_NAMES = tuple(t.__name__ for t in MESSAGE_TYPES)
+
+# bit 0 of a request store entry stands for the device itself, bit i + 1 for its i-th neighbor
+_SELF_BIT = np.uint64(1)
+_MAX_DEGREE = 63
+
+
+@dataclass
+class VectorizedStats:
+    runtime: int = 0
+    num_devices: int = 0
+    received_by_type: Dict[str, int] = field(default_factory=lambda: dict())
+    sent_by_type: Dict[str, int] = field(default_factory=lambda: dict())
+    lost_by_type: Dict[str, int] = field(default_factory=lambda: dict())
+    overflowed_by_type: Dict[str, int] = field(default_factory=lambda: dict())
+    input_queue_max: List[int] = field(default_factory=lambda: list())
+
+
+class _Outbox:
+    """Messages sent during a tick, kept in the order in which they were sent"""
+    def __init__(self):
+        self.src: List[np.ndarray] = []
+        self.dst: List[np.ndarray] = []
+        self.kind: List[np.ndarray] = []
+        self.key: List[np.ndarray] = []
+
+    def add(self, src: np.ndarray, dst: np.ndarray, kind: int, key: np.ndarray):
+        if src.size == 0:
+            return
+        self.src.append(src)
+        self.dst.append(dst)
+        self.kind.append(np.full(src.size, kind, dtype=np.int8))
+        self.key.append(key)
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        if not self.src:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0, dtype=np.int8), empty
+        return np.concatenate(self.src), np.concatenate(self.dst), np.concatenate(self.kind), np.concatenate(self.key)
+
+
+class VectorizedSimulator:
+    """
+    Struct-of-arrays counterpart of Simulator running the same distribution protocol as Device.
+    The whole network is kept in NumPy arrays (CSR adjacency, per device firmware and upgrade state,
+    devices x chunks presence matrix and dense store tables, see _key_column) and every tick is processed
+    by a few vectorized operations over all devices at once.
+
+    Every firmware (fw_type, version) present in the network occupies a contiguous range of chunk keys,
+    all firmwares of the same (fw_type, version) must therefore have the same number of chunks.
+    Chunk payloads are not simulated, stores are unbounded.
+    Loss decisions are drawn from a NumPy generator, thus results match the Device model statistically only.
+
+    With replicates > 1 the simulator runs an ensemble of independent replicates of the network at once,
+    each replicate having its own generator. A replicate stops being simulated once it converges
+    in run_until_converged, its runtime and statistics are then available through runtimes and replicate_stats.
+    """
+    def __init__(self, graph, default_device_type: int, default_running_firmware: Firmware,
+                 default_link_reliability: float, queues_max_len: Optional[int] = None, shuffle: bool = False,
+                 seed: Optional[int] = None, periodic_announce: int = 100, progress_timeout: int = 100,
+                 replicates: int = 1):
+        self._clock = Clock()
+        self.clock = self._clock.clock_view()
+        self.shuffle: bool = shuffle
+        self.periodic_announce: int = periodic_announce
+        self.progress_timeout: int = progress_timeout
+        self._announces_timeout: int = periodic_announce // 2
+        self._requests_timeout: int = progress_timeout // 2
+        self._datas_timeout: int = progress_timeout // 2
+        self._queues_max_len: Optional[int] = queues_max_len
+        seeds = np.random.SeedSequence(seed if seed is not None else random.getrandbits(64)).spawn(replicates)
+        self._rngs: List[np.random.Generator] = [np.random.default_rng(s) for s in seeds]
+
+        nodes = list(graph.nodes)
+        n = len(nodes)
+        int_mapping = {v: k for k, v in enumerate(nodes)}
+        self.num_devices: int = n
+        self.replicates: int = replicates
+
+        # topology, replicates are disjoint copies of the network, device i of replicate r has index r * n + i
+        total = n * replicates
+        self._total: int = total
+        self._replicate = np.repeat(np.arange(replicates, dtype=np.int64), n)
+        adj = [sorted(int_mapping[k] for k in graph.adj[label]) for label in nodes]
+        degree = np.array([len(a) for a in adj], dtype=np.int64)
+        if n and degree.max() > _MAX_DEGREE:
+            raise ValueError(f"Devices with more than {_MAX_DEGREE} neighbors are not supported")
+        indices = np.array([k for a in adj for k in a], dtype=np.int64)
+        self._degree = np.tile(degree, replicates)
+        self._indptr = np.zeros(total + 1, dtype=np.int64)
+        np.cumsum(self._degree, out=self._indptr[1:])
+        self._indices = (indices[None, :] + (np.arange(replicates, dtype=np.int64) * n)[:, None]).ravel()
+        self._edge_keys = np.repeat(np.arange(total, dtype=np.int64), self._degree) * total + self._indices
+        self._reliability = np.tile(np.array([
+            graph.nodes[label].get('msg_success_rate', default_link_reliability) for label in nodes
+        ], dtype=np.float64), replicates)
+
+        # firmware slots, i.e. chunk key ranges of each (fw_type, version)
+        firmwares = [graph.nodes[label].get('running_firmware', default_running_firmware) for label in nodes]
+        slots: Dict[Tuple[int, int], int] = {}
+        chunks: List[int] = []
+        for fw in firmwares:
+            slot = slots.setdefault((fw.fw_type, fw.version), len(slots))
+            if slot == len(chunks):
+                chunks.append(fw.data_size)
+            elif chunks[slot] != fw.data_size:
+                raise ValueError(f"Firmware {fw.fw_type} v{fw.version} has more than one size")
+
+        self._slot_type = np.array([t for t, _ in slots], dtype=np.int64)
+        self._slot_version = np.array([v for _, v in slots], dtype=np.int64)
+        self._slot_chunks = np.array(chunks, dtype=np.int64)
+        self._slot_offset = np.zeros(len(chunks), dtype=np.int64)
+        np.cumsum(self._slot_chunks[:-1], out=self._slot_offset[1:])
+        self._key_slot = np.repeat(np.arange(len(chunks), dtype=np.int64), self._slot_chunks)
+        self._max_chunks = int(self._slot_chunks.max())
+        keys = int(self._slot_chunks.sum())
+
+        # only chunks of upgrade targets (slots newer than another slot of the same type) are requested, sent
+        # as data and announced past their first chunk, stores hold columns just for them and for first chunks
+        target = np.array([any(t == other_t and v > other_v for other_t, other_v in slots) for t, v in slots],
+                          dtype=bool)
+        stored = np.repeat(target, self._slot_chunks)
+        stored[self._slot_offset] = True
+        columns = int(np.count_nonzero(stored))
+        self._key_column = np.full(keys, -1, dtype=np.int64)
+        self._key_column[stored] = np.arange(columns)
+
+        # per device state
+        self._dev_type = np.tile(np.array([
+            graph.nodes[label]['running_firmware'].fw_type if 'running_firmware' in graph.nodes[label]
+            else default_device_type
+            for label in nodes
+        ], dtype=np.int64), replicates)
+        self._running_slot = np.tile(np.array([slots[(fw.fw_type, fw.version)] for fw in firmwares], dtype=np.int64),
+                                     replicates)
+        self._upgrade_slot = np.full(total, -1, dtype=np.int64)
+        self._last_progress = np.full(total, -1, dtype=np.int64)
+        self._missing = np.zeros(total, dtype=np.int64)
+        self._last_periodic_announce = np.full(total, -periodic_announce, dtype=np.int64)
+        self._active = np.ones(total, dtype=bool)
+        self._converged_at = np.full(replicates, -1, dtype=np.int64)
+
+        self._present = np.zeros((total, keys), dtype=bool)
+        for i, slot in enumerate(self._running_slot):
+            self._present[i, self._slot_offset[slot]:self._slot_offset[slot] + self._slot_chunks[slot]] = True
+
+        # expiration times of store entries, indexed by [device, _key_column[key]]
+        self._announces_seen = np.full((total, columns), -1, dtype=np.int32)
+        self._datas_seen = np.full((total, columns), -1, dtype=np.int32)
+        self._requests_time = np.full((total, columns), -1, dtype=np.int32)
+        self._requests_devices = np.zeros((total, columns), dtype=np.uint64)
+
+        # input queues, all messages of all queues sorted by destination, FIFO within a destination
+        self._q_src = np.empty(0, dtype=np.int64)
+        self._q_dst = np.empty(0, dtype=np.int64)
+        self._q_kind = np.empty(0, dtype=np.int8)
+        self._q_key = np.empty(0, dtype=np.int64)
+
+        # per replicate message counters indexed by [replicate, message type]
+        self._received = np.zeros((replicates, 3), dtype=np.int64)
+        self._sent = np.zeros((replicates, 3), dtype=np.int64)
+        self._lost = np.zeros((replicates, 3), dtype=np.int64)
+        self._overflowed = np.zeros((replicates, 3), dtype=np.int64)
+        self._input_queue_max = np.zeros(total, dtype=np.int64)
+
+    @classmethod
+    def from_builder(cls, builder, shuffle: bool = False, seed: Optional[int] = None,
+                     replicates: int = 1) -> 'VectorizedSimulator':
+        """Creates the simulator from the inputs of a SimulationBuilder instead of building Devices"""
+        if builder._store_limits:
+            raise ValueError("Bounded stores are not supported")
+        return cls(
+            graph=builder._graph,
+            default_device_type=builder._default_device_type,
+            default_running_firmware=builder._default_running_firmware,
+            default_link_reliability=builder._default_link_reliability,
+            queues_max_len=builder._queues_max_len,
+            periodic_announce=builder._periodic_announce,
+            progress_timeout=builder._progress_timeout,
+            shuffle=shuffle,
+            seed=seed,
+            replicates=replicates
+        )
+
+    @property
+    def runtimes(self) -> np.ndarray:
+        """Convergence time of each replicate as recorded by run_until_converged, -1 if not converged yet"""
+        return self._converged_at.copy()
+
+    def running_versions(self) -> np.ndarray:
+        """Running firmware version of each device, indexed by [replicate, device]"""
+        return self._slot_version[self._running_slot].reshape(self.replicates, self.num_devices)
+
+    def converged_replicates(self, version: int = 2, dev_type: Optional[int] = None) -> np.ndarray:
+        """Same as general_stopping_condition with given version, evaluated for each replicate"""
+        running = self.running_versions()
+        if dev_type is not None:
+            running = running[:, self._dev_type[:self.num_devices] == dev_type]
+        return np.all(running == version, axis=1)
+
+    def converged(self, version: int = 2, dev_type: Optional[int] = None) -> bool:
+        return bool(np.all(self.converged_replicates(version, dev_type)))
+
+    def run_for(self, ticks: int):
+        start_at: int = self._clock.now
+        self.run_until(lambda _: self._clock.now - start_at >= ticks)
+
+    def run_until(self, stop_condition: Callable[['VectorizedSimulator'], bool]):
+        while not stop_condition(self):
+            self._tick()
+            self._clock.tick()
+
+    def run_until_converged(self, version: int = 2, dev_type: Optional[int] = None):
+        """Runs until all replicates converge, each replicate is frozen at the time of its convergence"""
+        while True:
+            converged = self.converged_replicates(version, dev_type) & (self._converged_at < 0)
+            self._converged_at[converged] = self._clock.now
+            self._active[np.repeat(converged, self.num_devices)] = False
+            if np.all(self._converged_at >= 0):
+                return
+
+            self._tick()
+            self._clock.tick()
+
+    def extract_stats(self, replicate: int = 0) -> VectorizedStats:
+        runtime = self._converged_at[replicate]
+        devices = slice(replicate * self.num_devices, (replicate + 1) * self.num_devices)
+        return VectorizedStats(
+            runtime=int(runtime) if runtime >= 0 else self._clock.now,
+            num_devices=self.num_devices,
+            received_by_type=dict(zip(MESSAGE_TYPE_NAMES, self._received[replicate].tolist())),
+            sent_by_type=dict(zip(MESSAGE_TYPE_NAMES, self._sent[replicate].tolist())),
+            lost_by_type=dict(zip(MESSAGE_TYPE_NAMES, self._lost[replicate].tolist())),
+            overflowed_by_type=dict(zip(MESSAGE_TYPE_NAMES, self._overflowed[replicate].tolist())),
+            input_queue_max=self._input_queue_max[devices].tolist()
+        )
+
+    def replicate_stats(self) -> List[VectorizedStats]:
+        return [self.extract_stats(r) for r in range(self.replicates)]
+
+    def _tick(self):
+        now = self._clock.now
+        out = _Outbox()
+
+        # Device.periodic_running_firmware_announcer
+        devs = np.flatnonzero(self._active & (now - self._last_periodic_announce > self.periodic_announce))
+        self._broadcast(out, devs, ANNOUNCE, self._slot_offset[self._running_slot[devs]])
+        self._last_periodic_announce[devs] = now
+
+        # Device.upgrade_process_timeout_handler
+        devs = np.flatnonzero(self._active & (self._upgrade_slot >= 0) &
+                              (now - self._last_progress > self.progress_timeout))
+        if devs.size:
+            present, valid = self._slot_presence(devs, self._upgrade_slot[devs])
+            first_missing = np.argmax(valid & ~present, axis=1)
+            keys = self._slot_offset[self._upgrade_slot[devs]] + first_missing
+            self._request_chunk_for_device(out, devs, keys, np.full(devs.size, _SELF_BIT), exclude=None)
+            self._last_progress[devs] = now
+
+        src, dev, kind, key = self._pop_messages()
+        slot = self._key_slot[key]
+        col = self._key_column[key]
+        own = self._slot_type[slot] == self._dev_type[dev]
+
+        # Device.on_before_message for data messages, foreign data are forwarded only the first time they're seen
+        is_data = kind == DATA
+        foreign_data = is_data & ~own
+        seen = foreign_data & (self._datas_seen[dev, col] >= now)
+        fresh = np.flatnonzero(foreign_data & ~seen)
+        self._datas_seen[dev[fresh], col[fresh]] = now + self._datas_timeout
+        satisfy = np.flatnonzero(is_data & ~seen)
+        self._try_satisfy_foreign_requests(out, dev[satisfy], key[satisfy])
+
+        # foreign announces are flooded once per announces store timeout
+        i = np.flatnonzero((kind == ANNOUNCE) & ~own)
+        fresh = i[self._announces_seen[dev[i], col[i]] < now]
+        self._announces_seen[dev[fresh], col[fresh]] = now + self._announces_timeout
+        self._broadcast(out, dev[fresh], ANNOUNCE, key[fresh], exclude=src[fresh])
+
+        # foreign requests are remembered for the requester and flooded further
+        i = np.flatnonzero((kind == REQUEST) & ~own)
+        self._request_chunk_for_device(out, dev[i], key[i], self._neighbor_bit(dev[i], src[i]), exclude=src[i])
+
+        self._on_announce_message(out, *self._select((kind == ANNOUNCE) & own, src, dev, key, slot))
+        self._on_request_message(out, *self._select((kind == REQUEST) & own, src, dev, key, slot))
+        self._on_data_message(out, *self._select(is_data & own, src, dev, key, slot))
+
+        self._deliver(out)
+
+    def _on_announce_message(self, out: _Outbox, src, dev, key, slot):
+        now = self._clock.now
+        newer = self._slot_version[slot] > self._slot_version[self._running_slot[dev]]
+        src, dev, key, slot = src[newer], dev[newer], key[newer], slot[newer]
+
+        init = self._upgrade_slot[dev] < 0
+        self._upgrade_slot[dev[init]] = slot[init]
+        self._last_progress[dev[init]] = -1
+        self._missing[dev[init]] = self._slot_chunks[slot[init]]
+
+        wanted = (self._upgrade_slot[dev] == slot) & ~self._present[dev, key]
+        src, dev, key = src[wanted], dev[wanted], key[wanted]
+
+        in_flight = self._mark_request_in_flight_for(dev, key, np.full(dev.size, _SELF_BIT))
+        send = ~in_flight
+        out.add(dev[send], src[send], REQUEST, key[send])
+        self._last_progress[dev] = now
+
+    def _on_request_message(self, out: _Outbox, src, dev, key, slot):
+        running = slot == self._running_slot[dev]
+        upgrading = ~running & (slot == self._upgrade_slot[dev])
+        present = self._present[dev, key]
+
+        missing = upgrading & ~present
+        self._request_chunk_for_device(out, dev[missing], key[missing], self._neighbor_bit(dev[missing], src[missing]),
+                                       exclude=src[missing])
+        self._mark_request_in_flight_for(dev[missing], key[missing], np.full(np.count_nonzero(missing), _SELF_BIT))
+
+        serve = np.flatnonzero((running | upgrading) & present)
+        src, dev, key, slot = src[serve], dev[serve], key[serve], slot[serve]
+        out.add(dev, src, DATA, key)
+
+        # Device._announce_next_chunk_to_device
+        chunk = key - self._slot_offset[slot]
+        present, valid = self._slot_presence(dev, slot)
+        following = present & valid & (np.arange(self._max_chunks) > chunk[:, None])
+        has_next = following.any(axis=1)
+        next_key = self._slot_offset[slot] + np.argmax(following, axis=1)
+        out.add(dev[has_next], src[has_next], ANNOUNCE, next_key[has_next])
+
+    def _on_data_message(self, out: _Outbox, src, dev, key, slot):
+        now = self._clock.now
+        accepted = (self._upgrade_slot[dev] == slot) & ~self._present[dev, key]
+        src, dev, key = src[accepted], dev[accepted], key[accepted]
+
+        self._present[dev, key] = True
+        self._missing[dev] -= 1
+        self._last_progress[dev] = now
+        self._requests_devices[dev, self._key_column[key]] &= ~_SELF_BIT
+        self._broadcast(out, dev, ANNOUNCE, key, exclude=src)
+
+        complete = dev[self._missing[dev] == 0]
+        self._running_slot[complete] = self._upgrade_slot[complete]
+        self._upgrade_slot[complete] = -1
+
+    def _request_chunk_for_device(self, out: _Outbox, dev, key, for_bits, exclude: Optional[np.ndarray]):
+        in_flight = self._mark_request_in_flight_for(dev, key, for_bits)
+        send = ~in_flight
+        self._broadcast(out, dev[send], REQUEST, key[send], exclude=None if exclude is None else exclude[send])
+
+    def _mark_request_in_flight_for(self, dev, key, bits) -> np.ndarray:
+        """Marks the request in flight and returns whether it has been in flight for anybody before"""
+        now = self._clock.now
+        col = self._key_column[key]
+        devices = self._requests_devices[dev, col]
+        valid = (devices != 0) & (self._requests_time[dev, col] >= now)
+        self._requests_devices[dev, col] = np.where(valid, devices, 0) | bits
+        self._requests_time[dev, col] = now + self._requests_timeout
+        return valid
+
+    def _try_satisfy_foreign_requests(self, out: _Outbox, dev, key):
+        col = self._key_column[key]
+        devices = self._requests_devices[dev, col]
+        valid = (devices != 0) & (self._requests_time[dev, col] >= self._clock.now)
+        self._requests_devices[dev, col] = np.where(valid, devices & _SELF_BIT, 0)
+
+        requesters = np.where(valid, devices & ~_SELF_BIT, 0)
+        bits = np.unpackbits(requesters.astype('<u8').view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+        rows, cols = np.nonzero(bits[:, 1:])
+        out.add(dev[rows], self._indices[self._indptr[dev[rows]] + cols], DATA, key[rows])
+
+    def _broadcast(self, out: _Outbox, dev, kind: int, key, exclude: Optional[np.ndarray] = None):
+        counts = self._degree[dev]
+        total = int(counts.sum())
+        if total == 0:
+            return
+        starts = np.repeat(self._indptr[dev] - (np.cumsum(counts) - counts), counts)
+        dst = self._indices[starts + np.arange(total)]
+        src = np.repeat(dev, counts)
+        key = np.repeat(key, counts)
+        if exclude is not None:
+            keep = dst != np.repeat(exclude, counts)
+            src, dst, key = src[keep], dst[keep], key[keep]
+        out.add(src, dst, kind, key)
+
+    def _neighbor_bit(self, dev, neighbor) -> np.ndarray:
+        local = np.searchsorted(self._edge_keys, dev * self._total + neighbor) - self._indptr[dev]
+        return np.left_shift(np.uint64(1), (local + 1).astype(np.uint64))
+
+    def _slot_presence(self, dev, slot) -> Tuple[np.ndarray, np.ndarray]:
+        """Presence of chunks of given firmware slots padded to the largest firmware, with the mask of valid chunks"""
+        chunks = np.arange(self._max_chunks)
+        valid = chunks < self._slot_chunks[slot][:, None]
+        keys = np.minimum(self._slot_offset[slot][:, None] + chunks, self._present.shape[1] - 1)
+        return self._present[dev[:, None], keys], valid
+
+    @staticmethod
+    def _select(mask, *arrays):
+        i = np.flatnonzero(mask)
+        return tuple(a[i] for a in arrays)
+
+    def _pop_messages(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Pops the oldest message of every non-empty input queue of active devices"""
+        dst = self._q_dst
+        if dst.size == 0:
+            return self._q_src, self._q_dst, self._q_kind, self._q_key
+
+        first = np.ones(dst.size, dtype=bool)
+        first[1:] = dst[1:] != dst[:-1]
+        first &= self._active[dst]
+        popped = (self._q_src[first], dst[first], self._q_kind[first], self._q_key[first])
+        rest = ~first
+        self._q_src, self._q_dst, self._q_kind, self._q_key = \
+            self._q_src[rest], dst[rest], self._q_kind[rest], self._q_key[rest]
+
+        np.add.at(self._received, (self._replicate[popped[1]], popped[2]), 1)
+        return popped
+
+    def _deliver(self, out: _Outbox):
+        src, dst, kind, key = out.arrays()
+        if src.size == 0:
+            return
+
+        reliability = self._reliability[src]
+        if np.any(reliability < 1.0):
+            delivered = self._uniform(self._replicate[src]) < reliability
+            np.add.at(self._lost, (self._replicate[src[~delivered]], kind[~delivered]), 1)
+            src, dst, kind, key = src[delivered], dst[delivered], kind[delivered], key[delivered]
+        np.add.at(self._sent, (self._replicate[src], kind), 1)
+
+        # devices send in order (or shuffled order), each device's messages in the order in which they were sent
+        if self.shuffle:
+            rank = np.concatenate([rng.permutation(self.num_devices) for rng in self._rngs])
+        else:
+            rank = np.arange(self._total)
+        order = np.argsort(rank[src], kind='stable')
+        src = np.concatenate((self._q_src, src[order]))
+        dst = np.concatenate((self._q_dst, dst[order]))
+        kind = np.concatenate((self._q_kind, kind[order]))
+        key = np.concatenate((self._q_key, key[order]))
+
+        order = np.argsort(dst, kind='stable')
+        src, dst, kind, key = src[order], dst[order], kind[order], key[order]
+
+        lengths = np.bincount(dst, minlength=self._total)
+        if self._queues_max_len is not None and np.any(lengths > self._queues_max_len):
+            # the oldest messages are dropped as in a deque with maxlen
+            starts = np.cumsum(lengths) - lengths
+            position = np.arange(dst.size) - starts[dst]
+            keep = position >= lengths[dst] - self._queues_max_len
+            np.add.at(self._overflowed, (self._replicate[dst[~keep]], kind[~keep]), 1)
+            src, dst, kind, key = src[keep], dst[keep], kind[keep], key[keep]
+            lengths = np.minimum(lengths, self._queues_max_len)
+
+        np.maximum(self._input_queue_max, lengths, out=self._input_queue_max)
+        self._q_src, self._q_dst, self._q_kind, self._q_key = src, dst, kind, key
+
+    def _uniform(self, replicate: np.ndarray) -> np.ndarray:
+        """One uniform draw per item, items of each replicate are drawn from the replicate's own generator"""
+        if self.replicates == 1:
+            return self._rngs[0].random(replicate.size)
+
+        order = np.argsort(replicate, kind='stable')
+        counts = np.bincount(replicate, minlength=self.replicates)
+        draws = np.empty(replicate.size, dtype=np.float64)
+        draws[order] = np.concatenate([rng.random(c) for rng, c in zip(self._rngs, counts)])
+        return draws
+
+
+@dataclass
+class ValidationResult:
+    device_runtimes: List[int]
+    vectorized_runtimes: List[int]
+    statistic: float
+    p_value: float
+    passed: bool
+
+
+def validate_against_device_model(builder_factory: Callable, dev_type: Optional[int] = None, replicates: int = 20,
+                                  shuffle: bool = True, alpha: float = 0.01) -> ValidationResult:
+    """
+    Runs the scenario given by builder_factory (returning a fresh SimulationBuilder) replicates times with both
+    Device based Simulator and VectorizedSimulator and compares distributions of their convergence times
+    by a two sample Kolmogorov-Smirnov test, the engines are considered equivalent unless p-value < alpha
+    """
+    device_runtimes = []
+    for _ in range(replicates):
+        s = builder_factory().build()
+        s.shuffle = shuffle
+        s.run_until(tracked_stopping_condition(s, dev_type=dev_type))
+        device_runtimes.append(s.clock.now)
+
+    v = VectorizedSimulator.from_builder(builder_factory(), shuffle=shuffle, replicates=replicates)
+    v.run_until_converged(dev_type=dev_type)
+    vectorized_runtimes = v.runtimes.tolist()
+
+    test = stats.ks_2samp(device_runtimes, vectorized_runtimes)
+    return ValidationResult(
+        device_runtimes=device_runtimes,
+        vectorized_runtimes=vectorized_runtimes,
+        statistic=float(test.statistic),
+        p_value=float(test.pvalue),
+        passed=bool(test.pvalue >= alpha)
+    )
@@ -1,5 +1,11 @@
+from strategy_simulator.eviction import LRUPolicy, EarliestExpiryPolicy, LFUPolicy, RandomPolicy
+from strategy_simulator.firmware import FW_TYPE_B
+from strategy_simulator.simulator import STORES
 from strategy_simulator.test_utils import setup_rng, soft_assert, avg_runtime, grid_single_type, grid_multi_type, \
-    barbell_single_type, barbell_multi_type
+    barbell_single_type, barbell_multi_type, grid_single_type_builder, barbell_multi_type_builder, \
+    event_driven_matches_tick_loop, partitioned_matches_single_process, resumed_matches_uninterrupted, \
+    bounded_stores_hold, message_counters_conserved, reset_matches_first_run, vectorized_matches_device_model
+from strategy_simulator.vectorized import validate_against_device_model
 
 NET_CATEGORIES = {
     'grid': None,
@@ -130,3 +136,158 @@ soft_assert(avg_runtime(
     ),
     20
 ), 2811.75, "1BK5--P5--1BK5 FW_Bx10 0.9")
+
+setup_rng()
+soft_assert(validate_against_device_model(
+    lambda: grid_single_type_builder(
+        grid_size_x=6,
+        grid_size_y=6,
+        fw_size=10,
+        link_reliability=0.9
+    ),
+    replicates=20
+).passed, True, "vectorized 6x6 FW_Ax10 0.9")
+
+setup_rng()
+soft_assert(validate_against_device_model(
+    lambda: barbell_multi_type_builder(
+        bell_size=4,
+        path_length=4,
+        fw_size=10,
+        link_reliability=0.95
+    ),
+    dev_type=FW_TYPE_B,
+    replicates=20
+).passed, True, "vectorized 1BK4--P4--1BK4 FW_Bx10 0.95")
+
+soft_assert(vectorized_matches_device_model(
+    lambda: grid_single_type_builder(
+        grid_size_x=10,
+        grid_size_y=10,
+        fw_size=10,
+        link_reliability=1.0
+    )
+), True, "vectorized lossless 10x10 FW_Ax10 1.0")
+
+soft_assert(vectorized_matches_device_model(
+    lambda: barbell_multi_type_builder(
+        bell_size=4,
+        path_length=4,
+        fw_size=10,
+        link_reliability=1.0
+    ),
+    dev_type=FW_TYPE_B
+), True, "vectorized lossless 1BK4--P4--1BK4 FW_Bx10 1.0")
+
+setup_rng()
+soft_assert(event_driven_matches_tick_loop(
+    lambda: grid_single_type_builder(
+        grid_size_x=6,
+        grid_size_y=6,
+        fw_size=10,
+        link_reliability=0.9
+    ).with_rng_streams()
+), True, "event-driven 6x6 FW_Ax10 0.9")
+
+setup_rng()
+soft_assert(event_driven_matches_tick_loop(
+    lambda: barbell_multi_type_builder(
+        bell_size=4,
+        path_length=4,
+        fw_size=10,
+        link_reliability=0.95
+    ).with_rng_streams(),
+    dev_type=FW_TYPE_B,
+    resume_after=20
+), True, "event-driven resumed 1BK4--P4--1BK4 FW_Bx10 0.95")
+
+setup_rng()
+soft_assert(partitioned_matches_single_process(
+    lambda: grid_single_type_builder(
+        grid_size_x=6,
+        grid_size_y=6,
+        fw_size=10,
+        link_reliability=0.9,
+        log_messages=True
+    ).with_rng_streams(),
+    parts=3
+), True, "partitioned 6x6 FW_Ax10 0.9")
+
+setup_rng()
+soft_assert(partitioned_matches_single_process(
+    lambda: barbell_multi_type_builder(
+        bell_size=4,
+        path_length=4,
+        fw_size=10,
+        link_reliability=1.0,
+        log_messages=True
+    ),
+    parts=2,
+    dev_type=FW_TYPE_B
+), True, "partitioned 1BK4--P4--1BK4 FW_Bx10 1.0")
+
+setup_rng()
+soft_assert(resumed_matches_uninterrupted(
+    lambda: grid_single_type_builder(
+        grid_size_x=6,
+        grid_size_y=6,
+        fw_size=10,
+        link_reliability=0.9,
+        log_messages=True
+    ).with_rng_streams(),
+    interrupt_at=40
+), True, "resumed 6x6 FW_Ax10 0.9")
+
+setup_rng()
+soft_assert(resumed_matches_uninterrupted(
+    lambda: barbell_multi_type_builder(
+        bell_size=4,
+        path_length=4,
+        fw_size=10,
+        link_reliability=0.95,
+        log_messages=True
+    ).with_rng_streams().with_event_driven_scheduler(),
+    interrupt_at=100,
+    dev_type=FW_TYPE_B
+), True, "resumed event-driven 1BK4--P4--1BK4 FW_Bx10 0.95")
+
+for policy in (LRUPolicy, EarliestExpiryPolicy, LFUPolicy, RandomPolicy):
+    setup_rng()
+    soft_assert(bounded_stores_hold(
+        lambda: grid_single_type_builder(
+            grid_size_x=6,
+            grid_size_y=6,
+            fw_size=20,
+            link_reliability=0.9
+        ).with_rng_streams(),
+        max_capacity=2,
+        policy=policy
+    ), True, f"bounded stores {policy.__name__} 6x6 FW_Ax20 0.9")
+
+setup_rng()
+soft_assert(message_counters_conserved(
+    lambda: grid_single_type_builder(
+        grid_size_x=6,
+        grid_size_y=6,
+        fw_size=10,
+        link_reliability=0.9,
+        log_messages=True
+    ).with_bounded_queues(2),
+    ticks=300
+), True, "counters conserved 6x6 FW_Ax10 0.9 queues of 2")
+
+
+def randomly_evicting_grid():
+    sb = grid_single_type_builder(
+        grid_size_x=6,
+        grid_size_y=6,
+        fw_size=20,
+        link_reliability=0.9
+    ).with_rng_streams()
+    for store in STORES:
+        sb.with_store_limit(store, 2, RandomPolicy)
+    return sb
+
+
+setup_rng()
+soft_assert(reset_matches_first_run(randomly_evicting_grid), True, "reset bounded stores RandomPolicy 6x6 FW_Ax20 0.9")